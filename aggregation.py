@@ -0,0 +1,100 @@
+"""
+集計・ピボットテーブル処理
+グループ化キーをカテゴリ型のコードに変換し、複数の集計関数を1回のgroupbyでまとめて計算する
+"""
+
+from io import BytesIO
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# 表示名 -> pandasの集計関数名
+AGG_FUNCTIONS: Dict[str, str] = {
+    "合計": "sum",
+    "平均": "mean",
+    "件数": "count",
+    "最小": "min",
+    "最大": "max",
+    "中央値": "median",
+    "標準偏差": "std",
+    "ユニーク数": "nunique",
+}
+
+# 表示名 -> 日時列をまとめる単位（pandasの期間頻度）
+TIME_GRAINS: Dict[str, str] = {
+    "日": "D",
+    "週": "W",
+    "月": "M",
+    "四半期": "Q",
+    "年": "Y",
+}
+
+# 集計値がない場合の列名
+ROW_COUNT_LABEL = "行数"
+
+
+def _group_key(series: pd.Series, time_grain: Optional[str]) -> pd.Series:
+    """グループ化キーをカテゴリ型に変換する（日時列は指定単位の期間にまとめる）"""
+    if time_grain and pd.api.types.is_datetime64_any_dtype(series.dtype):
+        if getattr(series.dtype, "tz", None) is not None:
+            series = series.dt.tz_localize(None)
+        # Period型はArrow形式に変換できず表示時に失敗するため、期間の開始日時に戻す
+        series = series.dt.to_period(TIME_GRAINS[time_grain]).dt.to_timestamp()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    return series.astype("category")
+
+
+def pivot_aggregate(df: pd.DataFrame, rows: List[str], columns: Optional[List[str]] = None,
+                    values: Optional[List[str]] = None, aggfuncs: Optional[List[str]] = None,
+                    time_grain: Optional[str] = None) -> pd.DataFrame:
+    """行・列・値・集計関数の指定からピボットテーブルを作成する
+
+    aggfuncs には AGG_FUNCTIONS の表示名を指定する。値を指定しない場合は行数を数える
+    """
+    columns = columns or []
+    values = [col for col in (values or []) if col not in rows + columns]
+    keys = rows + columns
+    if not keys:
+        raise ValueError("行または列を1つ以上指定してください")
+
+    frame = pd.DataFrame({key: _group_key(df[key], time_grain) for key in keys})
+    grouped = frame.join(df[values]).groupby(keys, observed=True, sort=True)
+
+    if values and aggfuncs:
+        # 1回のgroupbyで全ての値列・集計関数を計算する
+        result = grouped[values].agg([AGG_FUNCTIONS[name] for name in aggfuncs])
+        labels = {func: name for name, func in AGG_FUNCTIONS.items()}
+        result.columns = pd.MultiIndex.from_tuples(
+            [(value, labels[func]) for value, func in result.columns]
+        )
+    else:
+        result = grouped.size().to_frame(ROW_COUNT_LABEL)
+
+    if columns:
+        result = result.unstack(columns)
+
+    result.columns = [flatten_label(label) for label in result.columns]
+    return result
+
+
+def _label_part(part) -> str:
+    """列名の1段分を文字列にする（時刻を含まない日時は日付のみ）"""
+    if isinstance(part, pd.Timestamp) and part == part.normalize():
+        return str(part.date())
+    return str(part)
+
+
+def flatten_label(label) -> str:
+    """多段の列名を「売上 / 合計 / 東京」のような1段の文字列にする"""
+    if isinstance(label, tuple):
+        return " / ".join(_label_part(part) for part in label)
+    return _label_part(label)
+
+
+def pivot_to_excel(pivot: pd.DataFrame) -> bytes:
+    """ピボットテーブルをExcel形式のバイト列に変換する"""
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        pivot.to_excel(writer, sheet_name="ピボット")
+    return buffer.getvalue()
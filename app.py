@@ -1,11 +1,44 @@
 import base64
-from io import StringIO
+import os
+import time
 
 import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from aggregation import AGG_FUNCTIONS, TIME_GRAINS, pivot_aggregate, pivot_to_excel
+from config import (
+    DATABASE_URL, DATASET_MEMORY_BUDGET_MB, DATASET_SPILL_DIR, DATASET_SPILL_TO_DISK, INCREMENTAL_RELOAD,
+    JOB_MAX_WORKERS, JOB_POLL_INTERVAL_SECONDS, SQL_POOL_SIZE, USE_ARROW_DTYPES,
+)
+from dataset_store import DatasetStore, SessionHandle
+from filter_engine import FilterExpressionError, discard_masks, evaluate_filter, parse_filter
+from incremental import FileVersion, VersionIndex
+from jobs import CANCELLED, DONE, FAILED, JobExecutor
+from loaders import (
+    ARROW_DTYPE_BACKEND, append_rows, dataset_fingerprint, get_supported_extensions, iter_dataframe_chunks, load_csv_tail,
+    load_dataframe, read_column_names, supports_append, supports_column_projection,
+)
+from pairplot import DEFAULT_BINS, bin_centers, compute_pair_density, pair_grid
+from preview import filter_positions, get_page, page_count, sort_order
+from sql_source import (
+    create_pooled_engine, iter_query_chunks, query_fingerprint, read_query, sql_pivot, sqlalchemy_available,
+    supports_sql_pivot,
+)
+from streaming_stats import DatasetProfile
+from timeseries import RESAMPLE_FREQUENCIES, ROLLING_FUNCTIONS, add_rolling, build_time_index, resample_frame, slice_time_range
+from trendline import TRENDLINE_MODELS, fit_trendline
+from validation import MAX_BAD_ROWS, ValidationRuleError, infer_rules, parse_rules, rules_to_json, validate_chunks, validate_dataframe
+
+# 散布図でブラウザに送る点の数の上限（超える場合は表示用に間引く）
+SCATTER_MAX_POINTS = 20000
+
+# 共有ストアのデータセットを複数セッションで安全に参照できるよう、変更時は常にコピーする
+pd.set_option("mode.copy_on_write", True)
 
 # ページ設定
 st.set_page_config(
@@ -16,17 +49,44 @@ st.set_page_config(
 
 # タイトル
 st.title("📊 CSV データ分析・可視化アプリ")
-st.markdown("CSVファイルをアップロードして、データの可視化と統計分析を行います。")
+st.markdown("CSV・Excel・JSON・Parquetなどのファイルをアップロードして、データの可視化と統計分析を行います。")
 
 # サイドバー
 st.sidebar.header("⚙️ 設定")
 
-# CSVファイルアップロード
-uploaded_file = st.sidebar.file_uploader(
-    "CSVファイルを選択してください",
-    type=['csv'],
-    help="CSVファイルをドラッグ&ドロップまたはクリックして選択"
-)
+# データソースの選択（DATABASE_URLが設定されている場合はデータベースも選択できる）
+data_source = "ファイル"
+if DATABASE_URL:
+    data_source = st.sidebar.radio("データソース", ["ファイル", "データベース"], horizontal=True, key="data_source")
+
+uploaded_file = None
+sql_request = None
+if data_source == "ファイル":
+    # データファイルアップロード
+    uploaded_file = st.sidebar.file_uploader(
+        "データファイルを選択してください",
+        type=get_supported_extensions(),
+        help="CSV・Excel・JSON(NDJSON)・Parquet・Featherファイルをドラッグ&ドロップまたはクリックして選択"
+    )
+elif not sqlalchemy_available():
+    st.sidebar.error("データベースから読み込むには SQLAlchemy をインストールしてください（pip install sqlalchemy）")
+else:
+    # SQLクエリの入力（実行ボタンを押したクエリの結果を分析する）
+    sql_query_input = st.sidebar.text_area("SQLクエリ", placeholder="SELECT * FROM sales", key="sql_query")
+    sql_filter_input = st.sidebar.text_input(
+        "取得時の絞り込み（フィルタ式、オプション）",
+        key="sql_fetch_filter",
+        help="フィルタ式をSQLのWHERE句に変換し、データベース側で絞り込んでから取得します"
+    )
+    col1, col2 = st.sidebar.columns(2)
+    with col1:
+        if st.button("クエリを実行", type="primary", disabled=not sql_query_input.strip()):
+            st.session_state["sql_request"] = (sql_query_input, sql_filter_input.strip() or None)
+    with col2:
+        # 同じクエリの結果は全セッションで共有されるため、最新のデータが必要な場合のみ取得し直す
+        if st.button("最新のデータを再取得", disabled="sql_request" not in st.session_state):
+            st.session_state["sql_refreshed_at"] = time.time()
+    sql_request = st.session_state.get("sql_request")
 
 # アプリケーション設定
 st.sidebar.header("🎨 表示設定")
@@ -38,41 +98,567 @@ st.sidebar.selectbox(
     help="現在は表示のみ。将来のバージョンで実装予定"
 )
 
-# データ表示設定（将来の機能拡張用）
+# データ表示設定
 st.sidebar.checkbox("生データを常に表示", value=False, help="現在は表示のみ。将来のバージョンで実装予定")
-st.sidebar.slider("最大表示行数", 10, 1000, 100, help="現在は表示のみ。将来のバージョンで実装予定")
+page_size = st.sidebar.slider("1ページの表示行数", 10, 1000, 100, help="データプレビューで1ページに表示する行数")
 
 # 分析設定（将来の機能拡張用）
 st.sidebar.header("📊 分析設定")
 st.sidebar.slider("信頼水準", 0.90, 0.99, 0.95, 0.01, help="現在は表示のみ。将来のバージョンで実装予定")
 st.sidebar.slider("相関の閾値", 0.1, 0.9, 0.5, 0.1, help="現在は表示のみ。将来のバージョンで実装予定")
+streaming_mode = st.sidebar.checkbox(
+    "ストリーミング集計モード", value=False,
+    help="データ全体を読み込まずにチャンク単位で読み込み、基本統計・カテゴリ値の件数・Pearson相関・Z-scoreの閾値・重複行数の集計と"
+         "データ品質の検証だけを行います（プレビュー・グラフ・ピボットなどは表示されません）"
+)
+
+@st.cache_resource
+def get_dataset_store():
+    """全セッションで共有するデータセットストアを取得する関数（退避したデータセットのフィルタ式のマスクも破棄する）"""
+    return DatasetStore(
+        DATASET_MEMORY_BUDGET_MB * 1024 * 1024, DATASET_SPILL_TO_DISK, DATASET_SPILL_DIR, on_evict=discard_masks
+    )
+
+def get_session_id():
+    """現在のセッションIDを取得する関数"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "default"
+
+def release_data():
+    """このセッションが参照しているデータセットを解放する関数"""
+    dataset_key = st.session_state.pop("dataset_key", None)
+    if dataset_key is not None:
+        get_dataset_store().release(dataset_key, get_session_id())
+
+def acquire_dataset(dataset_key, loader):
+    """共有ストアからデータを取得する関数（同じデータセットは全セッションで1回だけ読み込む）"""
+    store = get_dataset_store()
+    session_id = get_session_id()
+    if "dataset_session" not in st.session_state:
+        # セッション状態が破棄されたときに参照を解除する
+        st.session_state["dataset_session"] = SessionHandle(store, session_id)
+    if st.session_state.get("dataset_key") != dataset_key:
+        release_data()
+    st.session_state["dataset_key"] = dataset_key
+    return store.acquire(dataset_key, session_id, loader)
+
+def load_data(file_content, file_name, dataset_key, columns=None, dtype_backend=None, previous=None, version=None):
+    """ファイルを共有ストア経由で読み込む関数（同じ内容のファイルは全セッションで1回だけ読み込む）
+
+    previous に追記前のバージョンを指定すると、前回のデータが残っていれば追記された行だけを解析する
+    """
+    def loader():
+        cached = get_dataset_store().peek(previous.dataset_key) if previous is not None else None
+        if cached is not None:
+            previous_df, encoding = cached
+            tail = load_csv_tail(file_content, previous.length, previous_df, encoding, columns, dtype_backend)
+            if tail is not None:
+                if version is not None:
+                    version.appended_rows = len(tail)
+                return append_rows(previous_df, tail), encoding
+        return load_dataframe(file_content, file_name, columns, dtype_backend)
+
+    return acquire_dataset(dataset_key, loader)
+
+@st.cache_resource
+def get_version_index():
+    """全セッションで共有するファイルのバージョン履歴を取得する関数（追記の検出に使用）"""
+    return VersionIndex()
+
+@st.cache_resource
+def get_sql_engine():
+    """全セッションで共有するコネクションプール付きのデータベースエンジンを取得する関数"""
+    return create_pooled_engine(DATABASE_URL, SQL_POOL_SIZE)
+
+def load_query_data(query, fetch_filter, dataset_key, dtype_backend=None):
+    """クエリ結果を共有ストア経由で取得する関数（同じクエリの結果は全セッションで1回だけ取得する）"""
+    return acquire_dataset(dataset_key, lambda: (read_query(get_sql_engine(), query, fetch_filter, dtype_backend), None))
+
+def show_memory_usage():
+    """共有ストアのメモリ使用状況をサイドバーに表示する関数"""
+    usage = get_dataset_store().usage()
+    used_mb = usage["used_bytes"] / 1024 / 1024
+    budget_mb = usage["budget_bytes"] / 1024 / 1024
+    st.sidebar.header("💾 メモリ使用状況")
+    st.sidebar.progress(min(used_mb / budget_mb, 1.0) if budget_mb > 0 else 1.0)
+    st.sidebar.caption(
+        f"使用中 {used_mb:,.1f} MB / 予算 {budget_mb:,.0f} MB"
+        f"（うち絞り込み結果などの派生データ {usage['derived_bytes'] / 1024 / 1024:,.1f} MB、データセット {usage['datasets']}件、ディスク退避 {usage['spilled']}件、参照セッション {usage['sessions']}件）"
+    )
+    if INCREMENTAL_RELOAD:
+        # 追記の検出用の集計結果はストアの外で保持するため、別に表示する
+        st.sidebar.caption(f"追記の検出用の集計結果 {get_version_index().profile_bytes() / 1024 / 1024:,.1f} MB")
 
 @st.cache_data
-def load_csv_data(file_content, file_name):
-    """CSVデータを読み込む関数（キャッシュ付き）"""
+def get_column_names(file_content, file_name):
+    """列の絞り込み用に列名の一覧を取得する関数（キャッシュ付き）"""
+    return read_column_names(file_content, file_name)
+
+def get_sort_order(df, dataset_key, column, ascending):
+    """列の並び順を取得する関数（共有ストアにデータセット・列ごとに保持）"""
+    return get_dataset_store().derived(dataset_key, ("sort", column, ascending), lambda: sort_order(df[column], ascending))
+
+def build_filter_mask(df, dataset_key, filter_key):
+    """数値範囲・カテゴリ値・フィルタ式の条件から行のマスクを作成する関数"""
+    numeric_filter, category_filter, filter_expression = filter_key
+    mask = None
+    if numeric_filter is not None:
+        col, (lower, upper) = numeric_filter
+        mask = df[col].between(lower, upper).to_numpy()
+    if category_filter is not None:
+        col, values = category_filter
+        category_mask = df[col].isin(values).to_numpy()
+        mask = category_mask if mask is None else mask & category_mask
+    if filter_expression:
+        # 条件ごとのマスクはフィルタ式エンジン側でキャッシュされる
+        expression_mask = evaluate_filter(df, filter_expression, dataset_key)
+        mask = expression_mask if mask is None else mask & expression_mask
+    return mask
+
+def get_row_positions(df, dataset_key, filter_key, sort_column, ascending):
+    """フィルタリング結果の行番号を表示順で取得する関数（共有ストアに条件ごとに保持）
+
+    ページを切り替えても再計算されないため、どのページの表示も先頭ページと同じコストで済む
+    """
+    def build():
+        mask = build_filter_mask(df, dataset_key, filter_key)
+        order = get_sort_order(df, dataset_key, sort_column, ascending) if sort_column else None
+        return filter_positions(len(df), mask, order)
+
+    return get_dataset_store().derived(dataset_key, ("positions", filter_key, sort_column, ascending), build)
+
+def get_filtered_data(df, dataset_key, filter_key):
+    """フィルタリング結果のDataFrameを取得する関数（共有ストアに保持し、統計・グラフ・分析で共有）"""
+    if filter_key == (None, None, None):
+        return df
+    return get_dataset_store().derived(
+        dataset_key, ("filtered", filter_key),
+        lambda: df.iloc[get_row_positions(df, dataset_key, filter_key, None, True)]
+    )
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def get_stream_head(_read_chunks, dataset_key):
+    """ストリーミング集計モードで列の構成とデータ型の判定に使う先頭のチャンクを取得する関数"""
+    chunks = _read_chunks()
+    try:
+        return next(chunks, None)
+    finally:
+        chunks.close()
+
+def profile_chunks(read_chunks, filter_key, numeric_cols, category_cols, ctx):
+    """データをチャンク単位で読み込み、フィルタ条件に一致する行を1パスで集計する関数（進捗報告・キャンセル対応）
+
+    read_chunks はファイルまたはクエリ結果のチャンクを順に返す関数。メモリには1チャンクずつしか読み込まない
+    """
+    profile = DatasetProfile(numeric_cols, category_cols)
+    source_rows = 0
+    for chunk in read_chunks():
+        ctx.report(0.0, f"{source_rows:,}行を集計済み")
+        source_rows += len(chunk)
+        mask = build_filter_mask(chunk, None, filter_key)
+        profile.update(chunk if mask is None else chunk[mask])
+    return {"profile": profile, "source_rows": source_rows}
+
+@st.cache_data(max_entries=32, show_spinner="データベースで集計しています...")
+def get_sql_pivot(query, fetch_filter, analysis_key, rows, columns, values, aggfuncs):
+    """ピボットテーブルをデータベースのGROUP BYで集計する関数（クエリ・絞り込み条件・集計条件ごとにキャッシュ）"""
+    return sql_pivot(get_sql_engine(), query, fetch_filter, analysis_key[1], list(rows), list(columns), list(values), list(aggfuncs))
+
+@st.cache_data(max_entries=32)
+def get_pivot(_df, analysis_key, rows, columns, values, aggfuncs, time_grain):
+    """ピボットテーブルを作成する関数（データセット・フィルタ条件・集計条件ごとにキャッシュ）"""
+    return pivot_aggregate(_df, list(rows), list(columns), list(values), list(aggfuncs), time_grain)
+
+def get_time_index(df, analysis_key, date_col):
+    """日時列でソートしたDataFrameを取得する関数（共有ストアに保持し、期間の絞り込みは二分探索で行う）"""
+    dataset_key, filter_key = analysis_key
+    numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+    return get_dataset_store().derived(
+        dataset_key, ("time_index", filter_key, date_col), lambda: build_time_index(df, date_col, numeric_cols)
+    )
+
+@st.cache_data(max_entries=32)
+def get_resampled(_indexed, analysis_key, date_col, start, end, value_cols, frequency, aggfuncs):
+    """期間を絞り込んでリサンプリングする関数（条件ごとにキャッシュ）"""
+    return resample_frame(slice_time_range(_indexed, start, end), list(value_cols), frequency, list(aggfuncs))
+
+@st.cache_resource
+def get_job_executor():
+    """全セッションで共有するバックグラウンドジョブの実行器を取得する関数"""
+    return JobExecutor(JOB_MAX_WORKERS)
+
+def get_dataset_profile(dataset_key, df):
+    """データセット全体の集計結果を取得する関数（未作成ならバックグラウンドで集計を始め、完了するまではNoneを返す）"""
+    version_index = get_version_index()
+    profile = version_index.profile(dataset_key)
+    if profile is None and version_index.needs_profile(dataset_key):
+        def build_profile(ctx):
+            # 集計結果はバージョン履歴に記録されるため、ジョブの結果としては保持しない
+            version_index.build_profile(dataset_key, df, ctx.report)
+
+        get_job_executor().submit((dataset_key, "profile"), build_profile)
+    return profile
+
+def run_job(slot, key, func, render, label):
+    """重い分析をバックグラウンドジョブとして実行し、完了後に結果を表示する関数
+
+    同じ枠（slot）で条件が変わった場合は前のジョブの待機を解除し、
+    他に待っているセッションがなければキャンセルする。実行中は枠内だけを定期的に再描画する
+    """
+    executor = get_job_executor()
+    session_id = get_session_id()
+    state_key = f"job_{slot}"
+    previous_key = st.session_state.get(state_key)
+    if previous_key is not None and previous_key != key:
+        executor.unsubscribe(previous_key, session_id)
+        st.session_state.pop(f"{state_key}_cancelled", None)
+    st.session_state[state_key] = key
+
+    if st.session_state.get(f"{state_key}_cancelled") == key:
+        st.warning(f"{label}はキャンセルされました")
+        if st.button("再実行", key=f"{state_key}_retry"):
+            st.session_state.pop(f"{state_key}_cancelled", None)
+            st.rerun()
+        return
+
+    job = executor.submit(key, func, session_id)
+    running = not job.finished
+
+    @st.fragment(run_every=JOB_POLL_INTERVAL_SECONDS if running else None)
+    def show_job():
+        if running and job.finished:
+            # 完了したらページ全体を再実行して、定期的な再描画を止める
+            st.rerun()
+        if job.status == DONE:
+            render(job.result)
+        elif job.status == FAILED:
+            st.error(f"{label}でエラーが発生しました: {job.error}")
+        elif job.status == CANCELLED:
+            st.warning(f"{label}はキャンセルされました")
+        else:
+            st.progress(job.progress, text=f"⏳ {label}を実行中... {job.message}（{job.elapsed:.0f}秒経過）")
+            if st.button("キャンセル", key=f"{state_key}_cancel"):
+                # 同じジョブを待っている他のセッションがあれば実行を続ける
+                executor.unsubscribe(key, session_id)
+                st.session_state[f"{state_key}_cancelled"] = key
+                st.rerun()
+
+    show_job()
+
+def compute_kendall_correlation(df, ctx):
+    """Kendall相関行列を列ペアごとに計算する関数（進捗報告・キャンセル対応）"""
+    from scipy import stats
+    columns = df.columns
+    matrix = np.eye(len(columns))
+    pairs = [(i, j) for i in range(len(columns)) for j in range(i + 1, len(columns))]
+    for done, (i, j) in enumerate(pairs):
+        ctx.report(done / len(pairs), f"{columns[i]} × {columns[j]}")
+        valid = df[[columns[i], columns[j]]].dropna()
+        corr = np.nan
+        if len(valid) > 1:
+            corr, _ = stats.kendalltau(valid.iloc[:, 0], valid.iloc[:, 1])
+        matrix[i, j] = matrix[j, i] = corr
+    return pd.DataFrame(matrix, index=columns, columns=columns)
+
+def find_duplicates(df, ctx, profile=None):
+    """重複行を検出する関数（件数・例・重複行のマスクを返す）
+
+    profile にデータセット全体の集計結果を渡すと、集計済みの重複行の位置を使って全行の判定を省略する。
+    重複を除いたCSVは結果に保持せず、ダウンロード時にマスクから作成する
+    """
+    ctx.report(0.0, "重複行を判定中")
+    duplicated = profile.duplicated() if profile is not None else df.duplicated().to_numpy()
+    duplicate_count = int(duplicated.sum())
+    if duplicate_count == 0:
+        return {"count": 0}
+    ctx.report(0.5, "重複行の例を抽出中")
+    if profile is not None:
+        examples = profile.duplicate_examples(df, 10)
+    else:
+        examples = df[df.duplicated(keep=False)].head(10)
+    return {
+        "count": duplicate_count,
+        "examples": examples,
+        "duplicated": duplicated,
+    }
+
+def pearson_correlation(df, columns, profile=None):
+    """Pearson相関行列を計算する関数（データセット全体の集計結果があれば共モーメントから求める）"""
+    if profile is not None and set(columns) <= set(profile.stats.columns):
+        return profile.stats.comoments.correlation().loc[columns, columns]
+    return df[columns].corr()
+
+@st.cache_data(max_entries=8)
+def get_inferred_rules(_df, analysis_key):
+    """データから推定した検証ルールをJSON文字列で取得する関数"""
+    return rules_to_json(infer_rules(_df))
+
+def validate_data(df, rules, ctx, read_chunks=None, filter_key=None):
+    """検証ルールの違反件数・違反例・違反行を集計する関数
+
+    read_chunks を指定した場合は df を列の構成だけに使い、データをチャンク単位で読み込みながら検証する
+    """
+    if read_chunks is None:
+        ctx.report(0.0, "全ルールを評価中")
+        validator = validate_dataframe(df, rules)
+    else:
+        validator = validate_chunks(
+            read_chunks(), rules, df.columns.tolist(),
+            row_filter=lambda chunk: build_filter_mask(chunk, None, filter_key),
+            progress=lambda rows: ctx.report(0.0, f"{rows:,}行を検証済み"),
+        )
+    ctx.report(1.0, "違反行を出力中")
+    bad_rows = validator.bad_rows_frame()
+    return {
+        "validator": validator,
+        "bad_csv": bad_rows.to_csv(index=False).encode('utf-8') if len(bad_rows) > 0 else None,
+    }
+
+def show_rule_validation(df, dataset_key, analysis_key, file_stem, validate, inference_key=None):
+    """ルールの編集欄と検証結果を表示する関数
+
+    df はルールの推定と列名の確認に使うデータ、validate は (ルール, ジョブのコンテキスト) を受け取り検証結果を返す関数。
+    推定したルールは inference_key（省略時は analysis_key）ごとにキャッシュする
+    """
+    # データセットが変わったらデータから推定したルールに戻す
+    st.write("**ルールによる検証**")
+    inferred_rules = get_inferred_rules(df, inference_key or analysis_key)
+    if st.session_state.get("validation_rules_dataset") != dataset_key:
+        st.session_state["validation_rules_dataset"] = dataset_key
+        st.session_state["validation_rules"] = inferred_rules
+
+    with st.expander("検証ルール（JSON）"):
+        st.caption(
+            "rule には type（数値・整数・日時・文字列）, not_null, range（min・max）, allowed（values）, "
+            "pattern（正規表現）, unique（columns）, expression（フィルタ式と同じ書式の列間の条件）を指定できます"
+        )
+        if st.button("データから推定したルールに戻す", key="validation_rules_reset"):
+            st.session_state["validation_rules"] = inferred_rules
+        rules_text = st.text_area("検証ルール", key="validation_rules", height=300, label_visibility="collapsed")
+        st.download_button(
+            label="📥 ルールをダウンロード",
+            data=rules_text.encode('utf-8'),
+            file_name=f"rules_{file_stem}.json",
+            mime="application/json"
+        )
+
+    def show_validation(result):
+        validator = result['validator']
+        scores = validator.category_scores()
+        if scores:
+            for col, (category, score) in zip(st.columns(len(scores)), scores.items()):
+                col.metric(category, f"{score:.1f}%")
+
+        st.dataframe(validator.report(), use_container_width=True)
+        st.caption(
+            f"{validator.rows:,}行に{len(validator.rules)}件のルールを適用しました"
+            f"（いずれかのルールに違反した行: {validator.bad_count:,}行）"
+        )
+
+        # ルールごとの違反例
+        for i, name in enumerate(validator.names):
+            if validator.counts[i] > 0:
+                with st.expander(f"{name}: {validator.counts[i]:,}件の違反"):
+                    st.dataframe(validator.sample(i), use_container_width=True)
+
+        if result['bad_csv'] is not None:
+            if validator.bad_count > MAX_BAD_ROWS:
+                st.caption(f"違反行のダウンロードは先頭の{MAX_BAD_ROWS:,}行までです")
+            st.download_button(
+                label="📥 違反行をダウンロード",
+                data=result['bad_csv'],
+                file_name=f"invalid_{file_stem}.csv",
+                mime="text/csv"
+            )
+
     try:
-        df = pd.read_csv(StringIO(file_content), encoding='utf-8')
-        return df, "utf-8"
-    except UnicodeDecodeError:
+        rules = parse_rules(rules_text, df.columns.tolist())
+    except ValidationRuleError as e:
+        st.error(f"❌ {e}")
+    else:
+        run_job(
+            "validation", (analysis_key, "validation", rules_to_json(rules)),
+            lambda ctx: validate(rules, ctx),
+            show_validation, "ルールによる検証"
+        )
+
+def show_streaming_analysis(read_chunks, dataset_key, file_stem):
+    """ストリーミング集計モードの画面を表示する関数
+
+    データ全体は読み込まず、基本統計・カテゴリ値の件数・Pearson相関・Z-scoreの閾値・重複行数を
+    チャンク単位の1パスで集計し、検証ルールもチャンク単位で適用する
+    """
+    head = get_stream_head(read_chunks, dataset_key)
+    if head is None or len(head.columns) == 0:
+        st.warning("データがありません")
+        return
+    numeric_cols = head.select_dtypes(include=['number']).columns.tolist()
+    categorical_cols = head.select_dtypes(include=['object', 'string', 'category']).columns.tolist()
+    st.info(
+        "ℹ️ ストリーミング集計モードでは、データ全体を読み込まずにチャンク単位で集計します。"
+        "列のデータ型は先頭のチャンクで判定し、以降のチャンクで変換できない値は欠損値として扱います"
+    )
+
+    # データ概要（先頭の行のみ表示）
+    st.header("📋 データ概要")
+    st.dataframe(head.head(page_size), use_container_width=True)
+    st.caption(f"先頭の{min(page_size, len(head))}行を表示しています（{len(head.columns)}列）")
+
+    # 絞り込みはフィルタ式で指定し、チャンクごとに適用する
+    filter_expression = st.text_input(
+        "フィルタ式（オプション）",
+        key="filter_expression",
+        placeholder="例: 売上 > 100000 and 地域 in ['東京', '大阪'] and 日付 >= '2023-06-01'",
+        help="数値範囲・カテゴリ値による絞り込みもフィルタ式で指定してください"
+    ).strip()
+    if filter_expression:
         try:
-            df = pd.read_csv(StringIO(file_content), encoding='shift_jis')
-            return df, "shift_jis"
-        except UnicodeDecodeError:
-            df = pd.read_csv(StringIO(file_content), encoding='cp932')
-            return df, "cp932"
+            parse_filter(filter_expression, head.columns.tolist())
+        except FilterExpressionError as e:
+            st.error(f"フィルタ式エラー: {e}")
+            filter_expression = ""
+    filter_key = (None, None, filter_expression or None)
+    analysis_key = (dataset_key, filter_key)
+
+    def show_profile(result):
+        profile = result["profile"]
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("行数", f"{profile.rows:,}")
+        with col2:
+            st.metric("列数", len(head.columns))
+        with col3:
+            st.metric("欠損値", f"{int(profile.nulls.sum()):,}")
+        with col4:
+            st.metric("重複行", f"{profile.duplicate_count:,} 行")
+        if profile.rows != result["source_rows"]:
+            st.info(f"フィルタリング結果: {result['source_rows']:,}行 → {profile.rows:,}行")
+        if profile.rows == 0:
+            return
+
+        st.header("📈 基本統計")
+        if numeric_cols:
+            st.dataframe(profile.stats.describe(), use_container_width=True)
+            st.caption(f"データをチャンク単位で読み込み、{profile.rows:,}行を1パスで集計しました（四分位数は計算しません）")
+        for col in categorical_cols[:3]:  # 最初の3列のみ表示
+            st.write(f"**{col}** の値の分布:")
+            st.bar_chart(profile.value_counts(col).head(10))
+
+        if len(numeric_cols) > 1:
+            st.header("🔗 相関分析")
+            fig = px.imshow(
+                profile.stats.comoments.correlation(), text_auto=True, aspect="auto",
+                color_continuous_scale="RdBu_r", title="相関行列 (pearson)"
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        if numeric_cols:
+            st.header("🎯 外れ値検出")
+            threshold = st.slider("Z-scoreの閾値", 2.0, 4.0, 3.0, key="stream_zscore_threshold")
+            bounds = [profile.stats.zscore_bounds(col, threshold) for col in numeric_cols]
+            st.dataframe(
+                pd.DataFrame(bounds, index=numeric_cols, columns=["下限", "上限"]), use_container_width=True
+            )
+            st.caption("Z-scoreの絶対値が閾値を超える値の境界です（外れ値の行の抽出には全データの読み込みが必要です）")
+
+    run_job(
+        "streaming_profile", (analysis_key, "streaming_profile"),
+        lambda ctx: profile_chunks(read_chunks, filter_key, numeric_cols, categorical_cols[:3], ctx),
+        show_profile, "チャンク単位の集計"
+    )
 
-def generate_html_report(df, filename):
-    """HTMLレポートを生成する関数"""
+    # ルールの推定は先頭のチャンクから行い、検証はデータをチャンク単位で読み込みながら行う
+    st.header("🔍 データ品質チェック")
+    show_rule_validation(
+        head, dataset_key, (analysis_key, "chunks"), file_stem,
+        lambda rules, ctx: validate_data(head, rules, ctx, read_chunks, filter_key),
+        inference_key=(dataset_key, "head")
+    )
+
+def run_normality_test(values, ctx):
+    """Shapiro-Wilk検定を行う関数"""
+    from scipy import stats
+    ctx.report(0.0, "Shapiro-Wilk検定を計算中")
+    stat, p_value = stats.shapiro(values)
+    return stat, p_value
+
+def get_display_sample(df, analysis_key, n):
+    """グラフ表示用に間引いた行を取得する関数（共有ストアに保持し、同じ条件では同じ行を使う）"""
+    dataset_key, filter_key = analysis_key
+    return get_dataset_store().derived(dataset_key, ("sample", filter_key, n), lambda: df.sample(n=n, random_state=42))
+
+@st.cache_data(max_entries=32)
+def get_trendline(_df, analysis_key, x_col, y_col, color_col, model, degree):
+    """回帰線を計算する関数（データセット・列・色分け・モデルごとにキャッシュ）"""
+    return fit_trendline(_df, x_col, y_col, model, color_col, degree)
+
+def build_pair_density(df, columns, bins, max_workers, ctx):
+    """ペアプロット用の密度グリッドを計算する関数（進捗報告・キャンセル対応）"""
+    return compute_pair_density(df, list(columns), bins, max_workers, progress=ctx.report)
+
+def create_pair_density_figure(density, title, height, log_scale=True):
+    """密度グリッドから対角にヒストグラムを並べたペアプロットを作成する関数"""
+    columns = density["columns"]
+    n = len(columns)
+    fig = make_subplots(rows=n, cols=n, horizontal_spacing=0.02, vertical_spacing=0.02)
+    for i, y_col in enumerate(columns):
+        for j, x_col in enumerate(columns):
+            x_centers = bin_centers(density["edges"][x_col])
+            if i == j:
+                fig.add_trace(go.Bar(
+                    x=x_centers, y=density["histograms"][x_col], name=x_col,
+                    marker_color="#1f77b4", showlegend=False
+                ), row=i + 1, col=j + 1)
+                continue
+            counts = pair_grid(density, x_col, y_col).T
+            fig.add_trace(go.Heatmap(
+                x=x_centers, y=bin_centers(density["edges"][y_col]),
+                z=np.log10(np.where(counts > 0, counts, np.nan)) if log_scale else counts,
+                customdata=counts, colorscale="Viridis", showscale=False,
+                hovertemplate=f"{x_col}: %{{x}}<br>{y_col}: %{{y}}<br>件数: %{{customdata}}<extra></extra>"
+            ), row=i + 1, col=j + 1)
+    for k, col in enumerate(columns):
+        fig.update_xaxes(title_text=col, row=n, col=k + 1)
+        fig.update_yaxes(title_text=col, row=k + 1, col=1)
+    fig.update_layout(title=title, height=max(height, 180 * n), bargap=0)
+    return fig
+
+def build_export_files(export_df, stats_df):
+    """フィルタリング結果をCSV・Excel・JSON・Parquet・Feather形式に変換する関数"""
+    from io import BytesIO
+    excel_buffer = BytesIO()
+    with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
+        export_df.to_excel(writer, sheet_name='データ', index=False)
+        if stats_df is not None:
+            stats_df.to_excel(writer, sheet_name='統計情報')
+
+    # Arrow形式の列はParquet・Featherへ変換せずにそのままのバッファを書き出せる
+    feather_buffer = BytesIO()
+    export_df.reset_index(drop=True).to_feather(feather_buffer)
+
+    return {
+        "csv": export_df.to_csv(index=False).encode('utf-8'),
+        "xlsx": excel_buffer.getvalue(),
+        "json": export_df.to_json(orient='records', force_ascii=False, indent=2).encode('utf-8'),
+        "parquet": export_df.to_parquet(index=False),
+        "feather": feather_buffer.getvalue(),
+    }
+
+def generate_html_report(df, filename, profile=None):
+    """HTMLレポートを生成する関数
+
+    profile（データセット全体の集計結果）を渡すと、値の件数・欠損数・相関係数は集計結果から求める
+    """
 
     numeric_cols = df.select_dtypes(include=['number']).columns
-    categorical_cols = df.select_dtypes(include=['object']).columns
+    categorical_cols = df.select_dtypes(include=['object', 'string', 'category']).columns
 
     # カテゴリデータの統計情報を生成
     categorical_stats = ""
     if len(categorical_cols) > 0:
         categorical_stats = "<h2>📊 カテゴリデータの統計</h2>"
         for col in categorical_cols[:5]:  # 最初の5列まで
-            value_counts = df[col].value_counts().head(10)
+            value_counts = (profile.value_counts(col) if profile is not None else df[col].value_counts()).head(10)
             categorical_stats += f"""
             <h3>{col}</h3>
             <table>
@@ -85,7 +671,7 @@ def generate_html_report(df, filename):
 
     # 欠損値の詳細情報
     missing_info = ""
-    missing_data = df.isnull().sum()
+    missing_data = profile.nulls.reindex(df.columns, fill_value=0) if profile is not None else df.isnull().sum()
     if missing_data.sum() > 0:
         missing_info = """
         <h2>⚠️ 欠損値の詳細</h2>
@@ -101,7 +687,7 @@ def generate_html_report(df, filename):
     # 相関分析の情報
     correlation_info = ""
     if len(numeric_cols) > 1:
-        corr_matrix = df[numeric_cols].corr()
+        corr_matrix = profile.stats.comoments.correlation() if profile is not None else df[numeric_cols].corr()
         correlation_info = """
         <h2>🔗 相関分析</h2>
         <p>数値データ間の相関係数（-1から1の範囲、1に近いほど正の相関、-1に近いほど負の相関）</p>
@@ -225,19 +811,87 @@ def generate_html_report(df, filename):
 
     return html
 
-if uploaded_file is not None:
+if uploaded_file is not None or sql_request is not None:
     try:
-        # ファイル内容を文字列として読み込み
-        file_content = uploaded_file.read().decode('utf-8', errors='ignore')
-        uploaded_file.seek(0)  # ファイルポインタをリセット
+        # Arrow形式では文字列もArrow配列のまま保持し、表示やParquet/Featherへの出力時の変換を省く
+        use_arrow = st.sidebar.checkbox(
+            "Arrow形式で読み込む", value=USE_ARROW_DTYPES,
+            help="文字列を含む全ての列をArrow形式（string[pyarrow]など）で保持し、メモリ使用量と表示・エクスポート時の変換コストを削減します"
+        )
+        dtype_backend = ARROW_DTYPE_BACKEND if use_arrow else None
+
+        if sql_request is not None:
+            # クエリ結果をサーバーサイドカーソルでチャンク単位に取得（結果はクエリのハッシュをキーに共有）
+            sql_query, sql_fetch_filter = sql_request
+            source_name = "SQLクエリ"
+            file_stem = "query"
+            dataset_key = query_fingerprint(
+                DATABASE_URL, sql_query, sql_fetch_filter, dtype_backend, st.session_state.get("sql_refreshed_at")
+            )
 
-        # キャッシュ機能付きでデータ読み込み
-        df, encoding = load_csv_data(file_content, uploaded_file.name)
+            def read_chunks():
+                return iter_query_chunks(get_sql_engine(), sql_query, sql_fetch_filter)
+
+            if not streaming_mode:
+                with st.spinner("データベースからデータを取得しています..."):
+                    df, encoding = load_query_data(sql_query, sql_fetch_filter, dataset_key, dtype_backend)
+        else:
+            # ファイル内容をバイト列として読み込み
+            file_content = uploaded_file.getvalue()
+            source_name = uploaded_file.name
+            file_stem = os.path.splitext(uploaded_file.name)[0]
+
+            # 列の絞り込みに対応した形式では、読み込む列を事前に選択できる
+            load_columns = None
+            if supports_column_projection(uploaded_file.name):
+                load_columns = st.sidebar.multiselect(
+                    "読み込む列（空の場合は全列）",
+                    get_column_names(file_content, uploaded_file.name),
+                    default=[],
+                    help="必要な列のみを読み込むことで、大きなファイルの読み込みを高速化します"
+                )
 
-        if encoding != "utf-8":
+            # 共有ストアからデータ読み込み（他のセッションで読み込み済みならそれを参照）
+            if streaming_mode:
+                # ストリーミング集計モードではデータ全体を読み込まない
+                dataset_key = dataset_fingerprint(file_content, load_columns, dtype_backend)
+            elif INCREMENTAL_RELOAD and supports_append(uploaded_file.name):
+                # 以前のバージョンの末尾に行が追記されただけなら、追記された行だけを解析する
+                version_index = get_version_index()
+                dataset_key, content_digest, previous_version = version_index.identify(file_content, load_columns, dtype_backend)
+                file_version = FileVersion(
+                    dataset_key, file_content, content_digest, load_columns, dtype_backend,
+                    previous_version.dataset_key if previous_version is not None else None
+                )
+                df, encoding = load_data(
+                    file_content, uploaded_file.name, dataset_key, load_columns, dtype_backend, previous_version, file_version
+                )
+                file_version = version_index.register(file_version)
+                file_version.rows = len(df)
+                if file_version.appended_rows is not None:
+                    st.info(f"ℹ️ 以前のバージョンに追記された{file_version.appended_rows:,}行のみを解析しました")
+            else:
+                dataset_key = dataset_fingerprint(file_content, load_columns, dtype_backend)
+                df, encoding = load_data(file_content, uploaded_file.name, dataset_key, load_columns, dtype_backend)
+
+            def read_chunks():
+                return iter_dataframe_chunks(file_content, uploaded_file.name, load_columns)
+
+        if streaming_mode:
+            # 以前に読み込んだデータセットの参照を解除し、チャンク単位の集計だけを表示する
+            release_data()
+            show_memory_usage()
+            show_streaming_analysis(read_chunks, dataset_key, file_stem)
+            st.stop()
+        show_memory_usage()
+
+        if encoding is not None and encoding != "utf-8":
             st.info(f"ℹ️ {encoding}エンコーディングで読み込みました")
 
-        st.success(f"✅ ファイル '{uploaded_file.name}' を正常に読み込みました")
+        if sql_request is not None:
+            st.success(f"✅ クエリ結果（{len(df):,}行）を取得しました")
+        else:
+            st.success(f"✅ ファイル '{uploaded_file.name}' を正常に読み込みました")
 
         # データ概要表示
         st.header("📋 データ概要")
@@ -256,8 +910,13 @@ if uploaded_file is not None:
         col1, col2 = st.columns(2)
 
         with col1:
-            # 行数制限
-            max_rows = st.slider("表示する行数", 5, min(len(df), 1000), min(len(df), 100))
+            # 並べ替え
+            sort_column = st.selectbox(
+                "並べ替える列",
+                ["なし"] + df.columns.tolist(),
+                key="sort_column"
+            )
+            sort_ascending = st.radio("並び順", ["昇順", "降順"], horizontal=True, key="sort_direction") == "昇順"
 
             # 列選択
             selected_columns = st.multiselect(
@@ -268,7 +927,8 @@ if uploaded_file is not None:
 
         # 数値列とカテゴリ列を定義
         numeric_cols = df.select_dtypes(include=['number']).columns
-        categorical_cols = df.select_dtypes(include=['object']).columns
+        categorical_cols = df.select_dtypes(include=['object', 'string', 'category']).columns
+        datetime_cols = df.select_dtypes(include=['datetime', 'datetimetz']).columns
 
         with col2:
             # 数値フィルタリング
@@ -285,8 +945,9 @@ if uploaded_file is not None:
                 key="category_filter"
             )
 
-        # フィルタリング適用
-        display_df = df.copy()
+        # フィルタリング条件
+        numeric_filter = None
+        category_filter = None
 
         # 数値フィルタリング
         if numeric_filter_col != "なし":
@@ -297,14 +958,11 @@ if uploaded_file is not None:
                 min_val, max_val, (min_val, max_val),
                 key="numeric_range"
             )
-            display_df = display_df[
-                (display_df[numeric_filter_col] >= filter_range[0]) &
-                (display_df[numeric_filter_col] <= filter_range[1])
-            ]
+            numeric_filter = (numeric_filter_col, tuple(filter_range))
 
         # カテゴリフィルタリング
         if category_filter_col != "なし":
-            unique_values = df[category_filter_col].unique()
+            unique_values = df[category_filter_col].dropna().unique().tolist()
             selected_values = st.multiselect(
                 f"{category_filter_col} の値を選択",
                 unique_values,
@@ -312,63 +970,130 @@ if uploaded_file is not None:
                 key="category_values"
             )
             if selected_values:
-                display_df = display_df[display_df[category_filter_col].isin(selected_values)]
-
-        # 列選択適用
-        if selected_columns:
-            display_df = display_df[selected_columns]
-
-        # 行数制限適用
-        display_df = display_df.head(max_rows)
+                category_filter = (category_filter_col, tuple(selected_values))
+
+        # フィルタ式（複数条件の組み合わせ）
+        filter_expression = st.text_input(
+            "フィルタ式（オプション）",
+            key="filter_expression",
+            placeholder="例: 売上 > 100000 and 地域 in ['東京', '大阪'] and 日付 >= '2023-06-01'",
+            help="and / or / not、比較演算子（== != < <= > >=）、in / not in、"
+                 "isnull(列)、notnull(列)、contains(列, '文字列')、startswith(列, '文字列') が使用できます。"
+                 "空白や記号を含む列名は `列名` のようにバッククォートで囲んでください"
+        ).strip()
+        if filter_expression:
+            try:
+                parse_filter(filter_expression, df.columns.tolist())
+            except FilterExpressionError as e:
+                st.error(f"フィルタ式エラー: {e}")
+                filter_expression = ""
+
+        filter_key = (numeric_filter, category_filter, filter_expression or None)
+
+        # フィルタリング結果の行番号（サーバー側で保持し、表示するページだけを切り出す）
+        sort_column = None if sort_column == "なし" else sort_column
+        try:
+            row_positions = get_row_positions(df, dataset_key, filter_key, sort_column, sort_ascending)
+        except FilterExpressionError as e:
+            # 型の異なる値との比較などは評価時に検出されるため、フィルタ式を使わずに続ける
+            st.error(f"フィルタ式エラー: {e}")
+            filter_key = (numeric_filter, category_filter, None)
+            row_positions = get_row_positions(df, dataset_key, filter_key, sort_column, sort_ascending)
+        preview_columns = selected_columns if selected_columns else df.columns.tolist()
 
         # フィルタリング結果の表示
-        if len(display_df) != len(df):
-            st.info(f"フィルタリング結果: {len(df)}行 → {len(display_df)}行")
+        if len(row_positions) != len(df):
+            st.info(f"フィルタリング結果: {len(df)}行 → {len(row_positions)}行")
 
-        # データプレビュー
+        # データプレビュー（表示中のページのみをブラウザに送信）
         st.subheader("📊 データプレビュー")
-        st.dataframe(display_df, use_container_width=True)
 
-        # データのダウンロード機能
+        total_pages = page_count(len(row_positions), page_size)
+        # ページ番号はセッション状態だけで管理する（絞り込みでページ数が減った場合は最終ページに合わせる）
+        st.session_state["preview_page"] = min(st.session_state.get("preview_page", 1), total_pages)
+        page = st.number_input(
+            f"ページ（全{total_pages}ページ）",
+            min_value=1, max_value=total_pages, step=1,
+            key="preview_page"
+        )
+        page_df = get_page(df, row_positions, int(page), page_size, preview_columns)
+        first_row = (int(page) - 1) * page_size + 1 if len(row_positions) > 0 else 0
+        st.caption(f"{len(row_positions)}行中 {first_row}〜{first_row + len(page_df) - 1 if len(page_df) > 0 else 0}行目を表示")
+        st.dataframe(page_df, use_container_width=True)
+
+        # データのダウンロード機能（フィルタリング結果全体を対象）
         st.subheader("📥 データエクスポート")
 
-        col1, col2, col3 = st.columns(3)
+        export_key = (dataset_key, filter_key, sort_column, sort_ascending, tuple(preview_columns))
+        if st.session_state.get("export_key") != export_key:
+            st.session_state.pop("export_files", None)
 
-        with col1:
-            # CSV形式でダウンロード
-            csv_data = display_df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="CSV形式でダウンロード",
-                data=csv_data,
-                file_name=f"filtered_{uploaded_file.name}",
-                mime="text/csv"
-            )
+        if st.button("エクスポートファイルを作成", help="フィルタリング結果の全行をCSV・Excel・JSON・Parquet・Feather形式に変換します"):
+            export_df = df[preview_columns].iloc[row_positions]
+            numeric_export_cols = export_df.columns.intersection(numeric_cols)
+            stats_df = export_df[numeric_export_cols].describe() if len(numeric_export_cols) > 0 else None
+            st.session_state["export_files"] = build_export_files(export_df, stats_df)
+            st.session_state["export_key"] = export_key
 
-        with col2:
-            # Excel形式でダウンロード
-            from io import BytesIO
-            excel_buffer = BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                display_df.to_excel(writer, sheet_name='データ', index=False)
-                if len(numeric_cols) > 0:
-                    df[numeric_cols].describe().to_excel(writer, sheet_name='統計情報')
+        export_files = st.session_state.get("export_files")
+        if export_files is not None:
+            col1, col2, col3 = st.columns(3)
 
-            st.download_button(
-                label="Excel形式でダウンロード",
-                data=excel_buffer.getvalue(),
-                file_name=f"filtered_{uploaded_file.name.replace('.csv', '.xlsx')}",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            with col1:
+                # CSV形式でダウンロード
+                st.download_button(
+                    label="CSV形式でダウンロード",
+                    data=export_files["csv"],
+                    file_name=f"filtered_{file_stem}.csv",
+                    mime="text/csv"
+                )
 
-        with col3:
-            # JSON形式でダウンロード
-            json_data = display_df.to_json(orient='records', force_ascii=False, indent=2)
-            st.download_button(
-                label="JSON形式でダウンロード",
-                data=json_data.encode('utf-8'),
-                file_name=f"filtered_{uploaded_file.name.replace('.csv', '.json')}",
-                mime="application/json"
-            )
+            with col2:
+                # Excel形式でダウンロード
+                st.download_button(
+                    label="Excel形式でダウンロード",
+                    data=export_files["xlsx"],
+                    file_name=f"filtered_{file_stem}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+
+            with col3:
+                # JSON形式でダウンロード
+                st.download_button(
+                    label="JSON形式でダウンロード",
+                    data=export_files["json"],
+                    file_name=f"filtered_{file_stem}.json",
+                    mime="application/json"
+                )
+
+            col1, col2, _ = st.columns(3)
+
+            with col1:
+                # Parquet形式でダウンロード
+                st.download_button(
+                    label="Parquet形式でダウンロード",
+                    data=export_files["parquet"],
+                    file_name=f"filtered_{file_stem}.parquet",
+                    mime="application/vnd.apache.parquet"
+                )
+
+            with col2:
+                # Feather形式でダウンロード
+                st.download_button(
+                    label="Feather形式でダウンロード",
+                    data=export_files["feather"],
+                    file_name=f"filtered_{file_stem}.feather",
+                    mime="application/vnd.apache.arrow.file"
+                )
+
+        # 以降の統計・グラフ・分析・レポートはフィルタリング結果を対象とする
+        # 絞り込みがない場合は、データセット全体の集計結果（追記時は追記された行だけで更新）を使う
+        profile = get_dataset_profile(dataset_key, df) if filter_key == (None, None, None) else None
+        df = get_filtered_data(df, dataset_key, filter_key)
+        analysis_key = (dataset_key, filter_key)
+        if len(df) == 0:
+            st.warning("条件に一致する行がないため、統計・グラフ・分析は表示できません")
+            st.stop()
 
         # 基本統計
         st.header("📈 基本統計")
@@ -383,9 +1108,130 @@ if uploaded_file is not None:
             st.subheader("カテゴリデータの統計")
             for col in categorical_cols[:3]:  # 最初の3列のみ表示
                 st.write(f"**{col}** の値の分布:")
-                value_counts = df[col].value_counts().head(10)
+                value_counts = (profile.value_counts(col) if profile is not None else df[col].value_counts()).head(10)
                 st.bar_chart(value_counts)
 
+        # 集計・ピボットテーブル
+        st.header("🧮 集計・ピボットテーブル")
+
+        group_candidates = list(categorical_cols) + list(datetime_cols) + [col for col in numeric_cols if pd.api.types.is_integer_dtype(df[col])]
+
+        col1, col2 = st.columns(2)
+        with col1:
+            pivot_rows = st.multiselect("行（グループ化する列）", group_candidates, key="pivot_rows")
+            pivot_columns = st.multiselect(
+                "列（横に展開する列、オプション）",
+                [col for col in group_candidates if col not in pivot_rows],
+                key="pivot_columns"
+            )
+        with col2:
+            pivot_values = st.multiselect("値（集計する数値列）", list(numeric_cols), key="pivot_values")
+            pivot_aggfuncs = st.multiselect("集計関数", list(AGG_FUNCTIONS), default=["合計"], key="pivot_aggfuncs")
+
+        pivot_time_grain = None
+        if any(col in datetime_cols for col in pivot_rows + pivot_columns):
+            pivot_time_grain = st.selectbox("日時列の集計単位", list(TIME_GRAINS), index=2, key="pivot_time_grain")
+
+        # データベースのクエリ結果は、GROUP BYに変換してデータベース側で集計することもできる
+        pivot_pushdown = False
+        if sql_request is not None:
+            pivot_pushdown = st.checkbox(
+                "集計をデータベースで実行", key="pivot_pushdown",
+                help="フィルタ条件と集計をSQLのWHERE句・GROUP BYに変換してデータベース側で計算します"
+            )
+            if pivot_pushdown and not supports_sql_pivot(pivot_aggfuncs, pivot_time_grain):
+                st.info("中央値・標準偏差・日時の集計単位はデータベースでは計算できないため、アプリ内で集計します")
+                pivot_pushdown = False
+
+        if pivot_rows:
+            if pivot_pushdown:
+                pivot_df = get_sql_pivot(
+                    sql_query, sql_fetch_filter, analysis_key, tuple(pivot_rows), tuple(pivot_columns),
+                    tuple(pivot_values), tuple(pivot_aggfuncs)
+                )
+            else:
+                pivot_df = get_pivot(
+                    df, analysis_key, tuple(pivot_rows), tuple(pivot_columns),
+                    tuple(pivot_values), tuple(pivot_aggfuncs), pivot_time_grain
+                )
+            st.caption(f"{len(pivot_df)}行 × {len(pivot_df.columns)}列")
+            st.dataframe(pivot_df, use_container_width=True)
+
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button(
+                    label="ピボットをCSV形式でダウンロード",
+                    data=pivot_df.to_csv().encode('utf-8'),
+                    file_name=f"pivot_{file_stem}.csv",
+                    mime="text/csv"
+                )
+            with col2:
+                st.download_button(
+                    label="ピボットをExcel形式でダウンロード",
+                    data=pivot_to_excel(pivot_df),
+                    file_name=f"pivot_{file_stem}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+        else:
+            st.info("行に1つ以上の列を選択すると、グループごとの集計結果を表示します")
+
+        # 時系列分析
+        if len(datetime_cols) > 0 and len(numeric_cols) > 0:
+            st.header("⏱️ 時系列分析")
+
+            col1, col2 = st.columns(2)
+            with col1:
+                ts_date_col = st.selectbox("日時列", list(datetime_cols), key="ts_date_col")
+                ts_value_cols = st.multiselect(
+                    "集計する数値列", list(numeric_cols),
+                    default=list(numeric_cols)[:1], key="ts_value_cols"
+                )
+            with col2:
+                ts_frequency = st.selectbox("集計単位", list(RESAMPLE_FREQUENCIES), index=1, key="ts_frequency")
+                ts_aggfuncs = st.multiselect("集計関数", list(AGG_FUNCTIONS), default=["合計"], key="ts_aggfuncs")
+
+            time_indexed = get_time_index(df, analysis_key, ts_date_col)
+            if len(time_indexed) > 0 and ts_value_cols and ts_aggfuncs:
+                min_date = time_indexed.index[0].date()
+                max_date = time_indexed.index[-1].date()
+
+                col1, col2 = st.columns(2)
+                with col1:
+                    ts_range = st.date_input(
+                        "期間", (min_date, max_date),
+                        min_value=min_date, max_value=max_date, key="ts_range"
+                    )
+                with col2:
+                    ts_window = st.number_input("移動窓の期間数（0で表示しない）", 0, 365, 0, key="ts_window")
+                    ts_rolling_func = st.selectbox("移動窓の集計", list(ROLLING_FUNCTIONS), key="ts_rolling_func")
+
+                # 期間の選択途中（開始日のみ）の場合は終了日を最終日とする
+                ts_start = pd.Timestamp(ts_range[0]) if len(ts_range) > 0 else None
+                ts_end = pd.Timestamp(ts_range[-1]) + pd.Timedelta(days=1) - pd.Timedelta(1, unit="ns") if len(ts_range) > 1 else None
+
+                resampled_df = get_resampled(
+                    time_indexed, analysis_key, ts_date_col, ts_start, ts_end,
+                    tuple(ts_value_cols), ts_frequency, tuple(ts_aggfuncs)
+                )
+                if ts_window > 0:
+                    resampled_df = add_rolling(resampled_df, int(ts_window), ts_rolling_func)
+
+                fig = px.line(
+                    resampled_df, x=resampled_df.index, y=resampled_df.columns.tolist(),
+                    title=f"{ts_date_col}別の推移（{ts_frequency}単位）",
+                    labels={'x': ts_date_col, 'value': '値', 'variable': '系列'}
+                )
+                st.plotly_chart(fig, use_container_width=True)
+
+                st.caption(f"{len(resampled_df)}期間（元データ {len(time_indexed)}行）")
+                st.dataframe(resampled_df, use_container_width=True)
+                st.download_button(
+                    label="時系列集計をCSV形式でダウンロード",
+                    data=resampled_df.to_csv().encode('utf-8'),
+                    file_name=f"timeseries_{file_stem}.csv",
+                    mime="text/csv"
+                )
+
         # グラフ作成セクション
         st.header("📊 データ可視化")
 
@@ -424,10 +1270,10 @@ if uploaded_file is not None:
                     st.plotly_chart(fig, use_container_width=True)
 
             elif chart_type == "線グラフ":
-                if len(numeric_cols) >= 2:
+                if len(datetime_cols) + len(numeric_cols) >= 2:
                     col1, col2 = st.columns(2)
                     with col1:
-                        x_col = st.selectbox("X軸", numeric_cols)
+                        x_col = st.selectbox("X軸", list(datetime_cols) + list(numeric_cols))
                         y_cols = st.multiselect("Y軸（複数選択可）", [col for col in numeric_cols if col != x_col])
                     with col2:
                         color_col = st.selectbox("色分け（オプション）", ["なし"] + list(categorical_cols), key="line_color")
@@ -469,15 +1315,47 @@ if uploaded_file is not None:
 
                     # 回帰線の追加オプション
                     add_trendline = st.checkbox("回帰線を追加")
-                    trendline = "ols" if add_trendline else None
+                    trend_model = "linear"
+                    trend_degree = 2
+                    if add_trendline:
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            trend_model = TRENDLINE_MODELS[st.selectbox("回帰モデル", list(TRENDLINE_MODELS), key="trend_model")]
+                        with col2:
+                            if trend_model == "polynomial":
+                                trend_degree = st.slider("多項式の次数", 2, 5, 2, key="trend_degree")
+
+                    # 点の数が多い場合は表示用に間引く（回帰線は全行で計算）
+                    plot_df = df
+                    if len(df) > SCATTER_MAX_POINTS:
+                        show_all_points = st.checkbox(f"全{len(df)}点を表示（描画が遅くなります）", key="scatter_all_points")
+                        if not show_all_points:
+                            plot_df = get_display_sample(df, analysis_key, SCATTER_MAX_POINTS)
+                            st.info(f"データが大きいため、{SCATTER_MAX_POINTS}点を抽出して表示します（回帰線は全{len(df)}行で計算）")
 
                     fig = px.scatter(
-                        df, x=x_col, y=y_col, color=color_col, size=size_col,
+                        plot_df, x=x_col, y=y_col, color=color_col, size=size_col,
                         title=chart_title, height=chart_height,
-                        trendline=trendline
+                        render_mode="webgl"
                     )
+
+                    if add_trendline:
+                        trend_fit, trend_lines = get_trendline(df, analysis_key, x_col, y_col, color_col, trend_model, trend_degree)
+                        # 色分けしている場合は各グループの点と同じ色で回帰線を描く
+                        trace_colors = {trace.name: trace.marker.color for trace in fig.data}
+                        for name, line in trend_lines.items():
+                            fig.add_trace(go.Scatter(
+                                x=line["x"], y=line["y"], mode="lines",
+                                name=f"回帰線（{name}）",
+                                line=dict(color=trace_colors.get(str(name)), width=3)
+                            ))
+
                     st.plotly_chart(fig, use_container_width=True)
 
+                    if add_trendline:
+                        st.write("**回帰線の係数**")
+                        st.dataframe(trend_fit, use_container_width=True)
+
             elif chart_type == "ヒストグラム":
                 col1, col2 = st.columns(2)
                 with col1:
@@ -564,22 +1442,50 @@ if uploaded_file is not None:
                     )
 
                     if len(selected_cols) >= 2:
-                        color_col = st.selectbox("色分け（オプション）", ["なし"] + list(categorical_cols), key="pair_color")
-                        color_col = None if color_col == "なし" else color_col
+                        pair_mode = st.radio(
+                            "表示方法", ["密度（全データ）", "散布図（サンプル）"],
+                            horizontal=True, key="pair_mode"
+                        )
 
-                        # サンプリング（大きなデータセットの場合）
-                        sample_size = min(1000, len(df))
-                        if len(df) > 1000:
-                            st.info(f"データが大きいため、{sample_size}行をサンプリングして表示します")
-                            sample_df = df.sample(n=sample_size, random_state=42)
+                        if pair_mode == "密度（全データ）":
+                            # 全行をビンに集計するため、表示するデータ量は行数ではなくビン数で決まる
+                            col1, col2, col3 = st.columns(3)
+                            with col1:
+                                pair_bins = st.slider("ビン数", 10, 100, DEFAULT_BINS, key="pair_bins")
+                            with col2:
+                                log_scale = st.checkbox("件数を対数で表示", value=True, key="pair_log")
+                            with col3:
+                                parallel = st.checkbox("列の組ごとに並列計算", value=len(selected_cols) > 3, key="pair_parallel")
+
+                            def show_pair_density(density):
+                                fig = create_pair_density_figure(density, chart_title, chart_height, log_scale)
+                                st.plotly_chart(fig, use_container_width=True)
+                                st.caption(f"全{density['rows']}行を{pair_bins}×{pair_bins}のグリッドに集計しています（色は件数）")
+
+                            # 全行の集計はバックグラウンドで実行する（並列計算の有無で結果は変わらないためキーに含めない）
+                            max_workers = (os.cpu_count() or 1) if parallel else 1
+                            run_job(
+                                "pair_density", (analysis_key, "pair_density", tuple(selected_cols), pair_bins),
+                                lambda ctx: build_pair_density(df, tuple(selected_cols), pair_bins, max_workers, ctx),
+                                show_pair_density, "ペアプロットの集計"
+                            )
                         else:
-                            sample_df = df
+                            color_col = st.selectbox("色分け（オプション）", ["なし"] + list(categorical_cols), key="pair_color")
+                            color_col = None if color_col == "なし" else color_col
+
+                            # サンプリング（大きなデータセットの場合）
+                            sample_size = min(1000, len(df))
+                            if len(df) > 1000:
+                                st.info(f"データが大きいため、{sample_size}行をサンプリングして表示します")
+                                sample_df = get_display_sample(df, analysis_key, sample_size)
+                            else:
+                                sample_df = df
 
-                        fig = px.scatter_matrix(
-                            sample_df, dimensions=selected_cols, color=color_col,
-                            title=chart_title, height=chart_height
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
+                            fig = px.scatter_matrix(
+                                sample_df, dimensions=selected_cols, color=color_col,
+                                title=chart_title, height=chart_height
+                            )
+                            st.plotly_chart(fig, use_container_width=True)
 
         # グラフのエクスポート機能
         st.subheader("📥 グラフのエクスポート")
@@ -613,39 +1519,48 @@ if uploaded_file is not None:
                 with col2:
                     show_values = st.checkbox("数値を表示", value=True)
 
-                # 相関行列
-                corr_matrix = df[numeric_cols].corr(method=corr_method)
-
-                # Plotlyでインタラクティブなヒートマップ
-                fig = px.imshow(
-                    corr_matrix,
-                    text_auto=show_values,
-                    aspect="auto",
-                    color_continuous_scale="RdBu_r",
-                    title=f"相関行列 ({corr_method})"
-                )
-                st.plotly_chart(fig, use_container_width=True)
+                def show_correlation(corr_matrix):
+                    # Plotlyでインタラクティブなヒートマップ
+                    fig = px.imshow(
+                        corr_matrix,
+                        text_auto=show_values,
+                        aspect="auto",
+                        color_continuous_scale="RdBu_r",
+                        title=f"相関行列 ({corr_method})"
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
 
-                # 強い相関のペアを表示
-                st.subheader("強い相関関係")
-                threshold = st.slider("相関の閾値", 0.5, 0.95, 0.7)
-
-                strong_corr = []
-                for i in range(len(corr_matrix.columns)):
-                    for j in range(i+1, len(corr_matrix.columns)):
-                        corr_val = corr_matrix.iloc[i, j]
-                        if abs(corr_val) >= threshold:
-                            strong_corr.append({
-                                '変数1': corr_matrix.columns[i],
-                                '変数2': corr_matrix.columns[j],
-                                '相関係数': round(corr_val, 3),
-                                '相関の強さ': '強い正の相関' if corr_val > 0 else '強い負の相関'
-                            })
-
-                if strong_corr:
-                    st.dataframe(pd.DataFrame(strong_corr), use_container_width=True)
+                    # 強い相関のペアを表示
+                    st.subheader("強い相関関係")
+                    threshold = st.slider("相関の閾値", 0.5, 0.95, 0.7)
+
+                    strong_corr = []
+                    for i in range(len(corr_matrix.columns)):
+                        for j in range(i+1, len(corr_matrix.columns)):
+                            corr_val = corr_matrix.iloc[i, j]
+                            if abs(corr_val) >= threshold:
+                                strong_corr.append({
+                                    '変数1': corr_matrix.columns[i],
+                                    '変数2': corr_matrix.columns[j],
+                                    '相関係数': round(corr_val, 3),
+                                    '相関の強さ': '強い正の相関' if corr_val > 0 else '強い負の相関'
+                                })
+
+                    if strong_corr:
+                        st.dataframe(pd.DataFrame(strong_corr), use_container_width=True)
+                    else:
+                        st.info(f"閾値 {threshold} 以上の相関関係は見つかりませんでした")
+
+                # 相関行列（Kendallは計算量が大きいためバックグラウンドで実行）
+                if corr_method == "kendall":
+                    run_job(
+                        "correlation", (analysis_key, "kendall", tuple(numeric_cols)),
+                        lambda ctx: compute_kendall_correlation(df[numeric_cols], ctx),
+                        show_correlation, "Kendall相関の計算"
+                    )
                 else:
-                    st.info(f"閾値 {threshold} 以上の相関関係は見つかりませんでした")
+                    show_correlation(pearson_correlation(df, numeric_cols, profile) if corr_method == "pearson"
+                                     else df[numeric_cols].corr(method=corr_method))
 
         with analysis_tabs[1]:
             # 統計検定
@@ -688,15 +1603,21 @@ if uploaded_file is not None:
                 elif test_type == "正規性検定":
                     test_col = st.selectbox("検定する列", numeric_cols)
 
-                    from scipy import stats
-
-                    # Shapiro-Wilk検定
-                    if len(df[test_col].dropna()) <= 5000:  # サンプルサイズ制限
-                        stat, p_value = stats.shapiro(df[test_col].dropna())
+                    def show_normality(result):
+                        stat, p_value = result
                         st.write("**Shapiro-Wilk検定結果**")
                         st.write(f"- 統計量: {stat:.4f}")
                         st.write(f"- p値: {p_value:.4f}")
                         st.write(f"- 結果: {'正規分布に従う' if p_value > 0.05 else '正規分布に従わない'}")
+
+                    # Shapiro-Wilk検定（バックグラウンドで実行）
+                    test_values = df[test_col].dropna()
+                    if len(test_values) <= 5000:  # サンプルサイズ制限
+                        run_job(
+                            "normality", (analysis_key, "shapiro", test_col),
+                            lambda ctx: run_normality_test(test_values, ctx),
+                            show_normality, "Shapiro-Wilk検定"
+                        )
                     else:
                         st.info("サンプルサイズが大きすぎるため、ヒストグラムで分布を確認してください")
 
@@ -740,7 +1661,7 @@ if uploaded_file is not None:
                     st.download_button(
                         label="📥 外れ値を除いたデータをダウンロード",
                         data=csv_clean,
-                        file_name=f"clean_{uploaded_file.name}",
+                        file_name=f"clean_{file_stem}.csv",
                         mime="text/csv"
                     )
 
@@ -754,9 +1675,6 @@ if uploaded_file is not None:
 
             quality_metrics = {
                 "完全性": f"{(1 - df.isnull().sum().sum() / (len(df) * len(df.columns))) * 100:.1f}%",
-                "重複行": f"{df.duplicated().sum()} 行 ({df.duplicated().sum()/len(df)*100:.1f}%)",
-                "データ型の一貫性": "チェック完了",
-                "値の範囲": "正常"
             }
 
             col1, col2 = st.columns(2)
@@ -777,29 +1695,44 @@ if uploaded_file is not None:
                 else:
                     st.success("欠損値はありません！")
 
-            # 重複行の詳細
-            if df.duplicated().sum() > 0:
-                st.write("**重複行の例:**")
-                duplicates = df[df.duplicated(keep=False)].head(10)
-                st.dataframe(duplicates, use_container_width=True)
+            def show_duplicates(result):
+                st.metric("重複行", f"{result['count']} 行 ({result['count']/len(df)*100:.1f}%)")
+
+                # 重複行の詳細
+                if result['count'] > 0:
+                    st.write("**重複行の例:**")
+                    st.dataframe(result['examples'], use_container_width=True)
+
+                    # 重複を除いたデータのダウンロード（CSVは作成ボタンを押したセッションだけが保持する）
+                    unique_key = (analysis_key, "unique_csv")
+                    if st.session_state.get("unique_csv_key") != unique_key:
+                        st.session_state.pop("unique_csv", None)
+                    if "unique_csv" not in st.session_state:
+                        if st.button("重複を除いたデータを作成", key="unique_csv_build"):
+                            st.session_state["unique_csv"] = df[~result['duplicated']].to_csv(index=False).encode('utf-8')
+                            st.session_state["unique_csv_key"] = unique_key
+                    if "unique_csv" in st.session_state:
+                        st.download_button(
+                            label="📥 重複を除いたデータをダウンロード",
+                            data=st.session_state["unique_csv"],
+                            file_name=f"unique_{file_stem}.csv",
+                            mime="text/csv"
+                        )
+
+            # 重複行の検出（全行の比較が必要なためバックグラウンドで実行、集計済みの場合は判定を省略）
+            run_job(
+                "duplicates", (analysis_key, "duplicates"),
+                lambda ctx: find_duplicates(df, ctx, profile),
+                show_duplicates, "重複行の検出"
+            )
 
-                # 重複を除いたデータのダウンロード
-                unique_data = df.drop_duplicates()
-                csv_unique = unique_data.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="📥 重複を除いたデータをダウンロード",
-                    data=csv_unique,
-                    file_name=f"unique_{uploaded_file.name}",
-                    mime="text/csv"
-                )
+            # ルールによる検証
+            show_rule_validation(df, dataset_key, analysis_key, file_stem, lambda rules, ctx: validate_data(df, rules, ctx))
 
         # HTMLレポート生成
         st.header("📄 HTMLレポート生成")
 
-        if st.button("HTMLレポートを生成", type="primary"):
-            # HTMLレポート作成
-            html_content = generate_html_report(df, uploaded_file.name)
-
+        def show_report(html_content):
             # ダウンロードリンク作成
             b64 = base64.b64encode(html_content.encode()).decode()
             href = f'<a href="data:text/html;base64,{b64}" download="data_report.html">📥 HTMLレポートをダウンロード</a>'
@@ -807,12 +1740,33 @@ if uploaded_file is not None:
 
             st.success("HTMLレポートが生成されました！上のリンクからダウンロードできます。")
 
+        report_key = (analysis_key, "report", source_name)
+        if st.button("HTMLレポートを生成", type="primary"):
+            st.session_state["report_key"] = report_key
+
+        # HTMLレポート作成（バックグラウンドで実行し、生成中も他の操作が可能）
+        if st.session_state.get("report_key") == report_key:
+            run_job(
+                "report", report_key,
+                lambda ctx: generate_html_report(df, source_name, profile),
+                show_report, "HTMLレポートの生成"
+            )
+
     except Exception as e:
         st.error(f"エラーが発生しました: {str(e)}")
-        st.info("CSVファイルの形式を確認してください。")
+        if sql_request is not None:
+            st.info("SQLクエリとデータベースの接続設定を確認してください。")
+        else:
+            st.info("ファイルの形式を確認してください。")
 
 else:
-    st.info("👆 サイドバーからCSVファイルをアップロードしてください")
+    release_data()
+    show_memory_usage()
+
+    if data_source == "データベース":
+        st.info("👆 サイドバーでSQLクエリを入力し、「クエリを実行」を押してください")
+    else:
+        st.info("👆 サイドバーからデータファイルをアップロードしてください")
 
     # サンプルデータ生成機能
     st.header("🎲 サンプルデータで試す")
@@ -892,7 +1846,7 @@ else:
     st.markdown("""
     ### 📝 使い方
     1. **サンプルデータで試す**: 上記のサンプルデータ生成機能を使用
-    2. **CSVファイルをアップロード**: サイドバーからファイルを選択
+    2. **データファイルをアップロード**: サイドバーからCSV・Excel・JSON・Parquetファイルを選択
     3. **データを探索**: 概要、統計、フィルタリング機能を活用
     4. **グラフを作成**: 10種類以上のグラフタイプから選択
     5. **統計分析**: 相関分析、統計検定、外れ値検出を実行
@@ -903,7 +1857,7 @@ else:
     - **多様なグラフ**: 円グラフ、面グラフ、バイオリンプロット、ペアプロット
     - **統計検定**: t検定、正規性検定、分散分析
     - **外れ値検出**: IQR法、Z-score法
-    - **データ品質チェック**: 完全性、重複、一貫性の確認
+    - **データ品質チェック**: 完全性、重複の確認と、型・値の範囲・形式・一意性などのルールによる検証
     - **インタラクティブな相関分析**: Plotlyベースのヒートマップ
 
     ### 💡 対応している機能
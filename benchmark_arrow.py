@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Arrow形式での読み込みのベンチマーク
+従来のNumPy/object形式とArrow形式（dtype_backend="pyarrow"）で、読み込み時間・メモリ使用量・
+画面表示用のArrow変換時間・Parquet/Featherへの出力時間を比較する
+
+使い方:
+    python benchmark_arrow.py                 # 日本語テキストの多いデータを生成して計測
+    python benchmark_arrow.py data.csv        # 指定したファイルで計測
+    python benchmark_arrow.py --rows 500000   # 生成するデータの行数を指定
+"""
+
+import argparse
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from loaders import ARROW_DTYPE_BACKEND, load_dataframe
+
+REPEAT = 3
+
+
+def generate_japanese_csv(rows: int, seed: int = 42) -> bytes:
+    """日本語テキストの多いCSVを生成する（エクスポートされた売上明細を想定）"""
+    rng = np.random.default_rng(seed)
+    regions = np.array(["北海道", "東北", "関東", "中部", "近畿", "中国", "四国", "九州・沖縄"])
+    products = np.array([f"商品{i:03d}（{kind}）" for i, kind in enumerate(["限定版", "通常版", "業務用", "お試しセット"] * 50)])
+    notes = np.array(["配送日時の指定あり", "ギフト包装希望", "領収書の発行が必要", "", "再配達依頼済み", "店舗受け取り"])
+    df = pd.DataFrame({
+        "受注番号": np.arange(rows) + 100000,
+        "受注日": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D"),
+        "地域": regions[rng.integers(0, len(regions), rows)],
+        "顧客名": [f"顧客{i % 50000:05d}様" for i in range(rows)],
+        "商品名": products[rng.integers(0, len(products), rows)],
+        "数量": rng.integers(1, 20, rows),
+        "単価": rng.integers(100, 50000, rows),
+        "備考": notes[rng.integers(0, len(notes), rows)],
+    })
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def measure(func, repeat: int = REPEAT) -> float:
+    """関数を繰り返し実行した最短時間（秒）を返す"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def serialize_for_display(df: pd.DataFrame) -> bytes:
+    """st.dataframeと同じくArrow IPCストリームに変換する"""
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_feather(df: pd.DataFrame) -> bytes:
+    """Feather形式に変換する"""
+    buffer = BytesIO()
+    df.to_feather(buffer)
+    return buffer.getvalue()
+
+
+def benchmark(content: bytes, file_name: str) -> pd.DataFrame:
+    """従来形式とArrow形式の計測結果を表にまとめる"""
+    results = {}
+    for label, backend in [("NumPy/object", None), ("Arrow", ARROW_DTYPE_BACKEND)]:
+        df, _ = load_dataframe(content, file_name, dtype_backend=backend)
+        # データプレビュー1ページ分と全体の両方を計測する
+        page = df.iloc[:1000]
+        results[label] = {
+            "読み込み（秒）": measure(lambda: load_dataframe(content, file_name, dtype_backend=backend)),
+            "メモリ使用量（MB）": df.memory_usage(deep=True).sum() / 1024 / 1024,
+            "表示用Arrow変換・全体（秒）": measure(lambda: serialize_for_display(df)),
+            "表示用Arrow変換・1ページ（秒）": measure(lambda: serialize_for_display(page)),
+            "Parquet出力（秒）": measure(lambda: df.to_parquet(index=False)),
+            "Feather出力（秒）": measure(lambda: to_feather(df)),
+            "文字列の値カウント（秒）": measure(
+                lambda: [df[col].value_counts() for col in df.select_dtypes(include=["object", "string"]).columns]
+            ),
+        }
+    table = pd.DataFrame(results)
+    table["Arrow / 従来"] = table["Arrow"] / table["NumPy/object"]
+    return table
+
+
+def main():
+    """コマンドライン引数に従ってベンチマークを実行する"""
+    parser = argparse.ArgumentParser(description="Arrow形式での読み込みのベンチマーク")
+    parser.add_argument("file", nargs="?", help="計測に使うファイル（省略時は日本語テキストの多いCSVを生成）")
+    parser.add_argument("--rows", type=int, default=200_000, help="生成するデータの行数")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            content = f.read()
+        file_name = os.path.basename(args.file)
+    else:
+        content = generate_japanese_csv(args.rows)
+        file_name = "benchmark.csv"
+
+    print(f"📊 {file_name}（{len(content) / 1024 / 1024:,.1f} MB）")
+    print(benchmark(content, file_name).round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
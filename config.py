@@ -30,9 +30,32 @@ DEBUG = get_env_bool("DEBUG", False)
 
 # ファイルアップロード設定
 MAX_UPLOAD_SIZE_MB = get_env_int("MAX_UPLOAD_SIZE_MB", 200)
-ALLOWED_FILE_TYPES = get_env_var("ALLOWED_FILE_TYPES", "csv,xlsx,json").split(",")
+ALLOWED_FILE_TYPES = get_env_var("ALLOWED_FILE_TYPES", "csv,xlsx,json,parquet,feather").split(",")
 
-# 将来の機能拡張用設定
+# データセット共有ストア設定（全セッション合計のメモリ予算）
+DATASET_MEMORY_BUDGET_MB = get_env_int("DATASET_MEMORY_BUDGET_MB", 2048)
+DATASET_SPILL_TO_DISK = get_env_bool("DATASET_SPILL_TO_DISK", True)
+DATASET_SPILL_DIR = get_env_var("DATASET_SPILL_DIR")
+
+# バックグラウンドジョブ設定
+JOB_MAX_WORKERS = get_env_int("JOB_MAX_WORKERS", 4)
+JOB_POLL_INTERVAL_SECONDS = get_env_int("JOB_POLL_INTERVAL_SECONDS", 1)
+
+# Arrow形式での読み込み設定（サイドバーの「Arrow形式で読み込む」の初期値）
+USE_ARROW_DTYPES = get_env_bool("USE_ARROW_DTYPES", False)
+
+# ストリーミング集計設定（チャンク単位で読み込む行数）
+STREAMING_CHUNK_SIZE = get_env_int("STREAMING_CHUNK_SIZE", 100_000)
+
+# 追記されたファイルの差分読み込み設定（以前のバージョンの末尾に行が追加されただけのCSVは追加分のみを解析する）
+INCREMENTAL_RELOAD = get_env_bool("INCREMENTAL_RELOAD", True)
+FILE_VERSION_HISTORY = get_env_int("FILE_VERSION_HISTORY", 8)
+
+# データベース接続設定（DATABASE_URLを設定するとサイドバーでデータベースを選択できる）
 DATABASE_URL = get_env_var("DATABASE_URL")
+SQL_POOL_SIZE = get_env_int("SQL_POOL_SIZE", 5)
+SQL_CHUNK_SIZE = get_env_int("SQL_CHUNK_SIZE", 50_000)
+
+# 将来の機能拡張用設定
 API_KEY = get_env_var("API_KEY")
 SECRET_KEY = get_env_var("SECRET_KEY")
\ No newline at end of file
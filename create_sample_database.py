@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+サンプルデータベースの作成スクリプト
+同梱のサンプルCSVをSQLiteのテーブルに書き込み、DATABASE_URLからの読み込みをローカルで試せるようにする
+
+使い方:
+    python create_sample_database.py                 # sample_data.db を作成
+    DATABASE_URL=sqlite:///sample_data.db streamlit run app.py
+"""
+
+import argparse
+import os
+import sqlite3
+
+import pandas as pd
+
+# CSVファイル名 -> テーブル名
+SAMPLE_TABLES = {
+    "sample_sales_data.csv": "sales",
+    "sample_customer_data.csv": "customers",
+    "sample_survey_data.csv": "survey",
+}
+
+
+def main():
+    """サンプルCSVをSQLiteに書き込む"""
+    parser = argparse.ArgumentParser(description="サンプルCSVからSQLiteのデータベースを作成する")
+    parser.add_argument("path", nargs="?", default="sample_data.db", help="作成するSQLiteファイル")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    with sqlite3.connect(args.path) as conn:
+        for file_name, table in SAMPLE_TABLES.items():
+            df = pd.read_csv(os.path.join(base_dir, file_name))
+            df.to_sql(table, conn, if_exists="replace", index=False)
+            print(f"✅ {table}: {len(df)}行")
+
+    print(f"📦 DATABASE_URL=sqlite:///{args.path} を設定してアプリを起動してください")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+セッション間で共有するデータセットストア
+ファイル内容のフィンガープリントをキーにDataFrameをプロセス内で1つだけ保持し、
+参照中のセッションを数えながらメモリ予算を超えた分を古い順にディスクへ退避（または破棄）する。
+絞り込み結果や並び順などデータセットから作る派生データもデータセットごとに保持し、
+メモリ使用量に含めたうえでデータセットの退避時に一緒に破棄する
+"""
+
+import atexit
+import os
+import pickle
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+# データセット1件あたりに保持する派生データの件数の上限
+DERIVED_MAX_ENTRIES = 16
+
+
+def estimate_nbytes(value: Any) -> int:
+    """派生データのメモリ使用量を見積もる
+
+    DataFrameの文字列などのオブジェクトは元のデータセットと共有されるため、配列部分だけを数える
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return int(getattr(value, "nbytes", 0))
+
+
+class _Entry:
+    """ストアに保持するデータセット1件分の情報"""
+
+    def __init__(self, df: pd.DataFrame, meta: Any, nbytes: int):
+        self.df: Optional[pd.DataFrame] = df
+        self.meta = meta
+        self.nbytes = nbytes
+        self.sessions: Set[str] = set()
+        self.spill_path: Optional[str] = None
+        # ディスクへの書き出し中のデータセット（書き出しが終わるまでは読み戻さずにそのまま使える）
+        self.spilling: Optional[pd.DataFrame] = None
+        # 派生データの名前 -> (値, 見積もったバイト数)
+        self.derived: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self.derived_bytes = 0
+
+    def clear_derived(self) -> None:
+        """派生データを破棄する"""
+        self.derived.clear()
+        self.derived_bytes = 0
+
+    def reattach(self) -> bool:
+        """書き出し中のデータセットをメモリ上に戻す（戻せた場合、または既にメモリ上にある場合はTrue）"""
+        if self.df is None and self.spilling is not None:
+            self.df, self.spilling = self.spilling, None
+        return self.df is not None
+
+
+class DatasetStore:
+    """フィンガープリントをキーにしたプロセス共通のデータセット置き場（スレッドセーフ）
+
+    on_evict にはデータセットが退避・破棄されたときにキーを受け取る関数を指定できる（外部のキャッシュの破棄用）
+    """
+
+    def __init__(self, budget_bytes: int, spill_to_disk: bool = True, spill_dir: Optional[str] = None,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.budget_bytes = budget_bytes
+        self.spill_to_disk = spill_to_disk
+        self.spill_dir = spill_dir
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        # プロセス終了時に退避ファイルを残さない
+        atexit.register(self.clear)
+
+    def acquire(self, key: str, session_id: str, loader: Callable[[], Tuple[pd.DataFrame, Any]]) -> Tuple[pd.DataFrame, Any]:
+        """データセットを参照登録して取得する（未登録ならloaderで読み込む）
+
+        戻り値は (読み取り専用として扱うDataFrameのビュー, loaderが返したメタ情報)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.reattach():
+                result = self._checkout(key, entry, session_id)
+                victims = self._enforce_budget()
+            else:
+                key_lock = self._loading.setdefault(key, threading.Lock())
+                victims = None
+        if victims is not None:
+            self._write_spills(victims)
+            return result
+
+        # 同じデータセットを複数セッションが同時に開いた場合も読み込み（退避ファイルの読み戻し）は1回だけ行う
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.reattach():
+                    self._loading.pop(key, None)
+                    result = self._checkout(key, entry, session_id)
+                    victims = self._enforce_budget()
+                else:
+                    spill_path = entry.spill_path if entry is not None else None
+                    victims = None
+            if victims is not None:
+                self._write_spills(victims)
+                return result
+
+            # ディスクからの読み戻しやloaderの実行中も、他のデータセットを参照するセッションは待たせない
+            df = None
+            try:
+                if spill_path is not None:
+                    df, meta = self._read_spill(spill_path), entry.meta
+            except FileNotFoundError:
+                # 読み戻し前に clear で退避ファイルが削除された場合は読み込み直す
+                pass
+            if df is None:
+                df, meta = loader()
+                entry = _Entry(df, meta, int(df.memory_usage(deep=True).sum()))
+
+            with self._lock:
+                if entry.spill_path is not None:
+                    self._remove_spill(entry)
+                entry.df = df
+                self._entries[key] = entry
+                self._loading.pop(key, None)
+                result = self._checkout(key, entry, session_id)
+                victims = self._enforce_budget()
+            self._write_spills(victims)
+            return result
+
+    def _checkout(self, key: str, entry: _Entry, session_id: str) -> Tuple[pd.DataFrame, Any]:
+        """参照を登録してビューを返す（ロック取得済みで呼び出す）"""
+        entry.sessions.add(session_id)
+        self._entries.move_to_end(key)
+        return entry.df.copy(deep=False), entry.meta
+
+    def peek(self, key: str) -> Optional[Tuple[pd.DataFrame, Any]]:
+        """参照登録せずにデータセットを取得する（未登録ならNone）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.df is not None or entry.spilling is not None:
+                df = entry.df if entry.df is not None else entry.spilling
+                return df.copy(deep=False), entry.meta
+            spill_path, meta = entry.spill_path, entry.meta
+        try:
+            return self._read_spill(spill_path), meta
+        except FileNotFoundError:
+            # 読み戻しと同時に退避ファイルが削除された場合
+            return None
+
+    def derived(self, key: str, name: Hashable, build: Callable[[], Any]) -> Any:
+        """データセットから作る派生データ（絞り込み結果・並び順など）を取得する（なければbuildで作成して保持）
+
+        派生データはメモリ使用量に含め、データセットの退避・破棄時に一緒に破棄する。
+        データセットがメモリ上にない場合は保持せずに作成した値を返す
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and name in entry.derived:
+                entry.derived.move_to_end(name)
+                return entry.derived[name][0]
+
+        value = build()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.df is None:
+                return value
+            if name in entry.derived:
+                return value
+            nbytes = estimate_nbytes(value)
+            entry.derived[name] = (value, nbytes)
+            entry.derived_bytes += nbytes
+            while len(entry.derived) > DERIVED_MAX_ENTRIES:
+                _, (_, evicted_bytes) = entry.derived.popitem(last=False)
+                entry.derived_bytes -= evicted_bytes
+            victims = self._enforce_budget()
+        self._write_spills(victims)
+        return value
+
+    def release(self, key: str, session_id: str) -> None:
+        """セッションによるデータセットの参照を解除する"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.sessions.discard(session_id)
+            victims = self._enforce_budget()
+        self._write_spills(victims)
+
+    def release_session(self, session_id: str) -> None:
+        """セッションが参照している全てのデータセットの参照を解除する"""
+        with self._lock:
+            for entry in self._entries.values():
+                entry.sessions.discard(session_id)
+            victims = self._enforce_budget()
+        self._write_spills(victims)
+
+    def usage(self) -> Dict[str, int]:
+        """メモリ使用量（派生データを含む）とデータセット数を返す"""
+        with self._lock:
+            in_memory = [entry for entry in self._entries.values() if entry.df is not None]
+            return {
+                "used_bytes": self._used_bytes(),
+                "derived_bytes": sum(entry.derived_bytes for entry in in_memory),
+                "budget_bytes": self.budget_bytes,
+                "datasets": len(in_memory),
+                "spilled": len(self._entries) - len(in_memory),
+                "sessions": len({session for entry in self._entries.values() for session in entry.sessions}),
+            }
+
+    def _used_bytes(self) -> int:
+        """メモリ上のデータセットと派生データの合計バイト数（ロック取得済みで呼び出す）"""
+        return sum(entry.nbytes + entry.derived_bytes for entry in self._entries.values() if entry.df is not None)
+
+    def _enforce_budget(self) -> List[Tuple[str, _Entry, pd.DataFrame]]:
+        """メモリ予算を超えている間、古いものから退避する（ロック取得済みで呼び出す）
+
+        参照されていないデータセットを派生データごと退避し、それでも超える場合は
+        参照中のデータセットの派生データを破棄する（最後に使われたデータセットの派生データは残す）。
+        退避するデータセットはメモリから切り離して返すので、ロックを解放してから _write_spills で書き出す
+        """
+        victims = []
+        used = self._used_bytes()
+        for key in list(self._entries):
+            if used <= self.budget_bytes:
+                return victims
+            entry = self._entries[key]
+            if entry.df is None or entry.sessions:
+                continue
+            used -= entry.nbytes + entry.derived_bytes
+            if self.spill_to_disk:
+                victims.append((key, entry, entry.df))
+                entry.spilling, entry.df = entry.df, None
+                entry.clear_derived()
+            else:
+                self._remove_spill(entry)
+                del self._entries[key]
+            if self.on_evict is not None:
+                self.on_evict(key)
+
+        for key in list(self._entries)[:-1]:
+            if used <= self.budget_bytes:
+                break
+            entry = self._entries[key]
+            used -= entry.derived_bytes
+            entry.clear_derived()
+        return victims
+
+    def _write_spills(self, victims: List[Tuple[str, _Entry, pd.DataFrame]]) -> None:
+        """切り離したデータセットをディスクに書き出す（ロックを解放してから呼び出す）
+
+        書き出し中も他のセッションは待たせない。書き出し中に読み戻された・削除されたデータセットのファイルは削除する
+        """
+        for key, entry, df in victims:
+            spill_path = None
+            try:
+                fd, spill_path = tempfile.mkstemp(prefix="dataset_", suffix=".pkl", dir=self.spill_dir)
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            except OSError:
+                # ディスクに書き出せない場合は退避せずに破棄する（次に参照されたときに読み込み直す）
+                if spill_path is not None:
+                    os.remove(spill_path)
+                with self._lock:
+                    if entry.spilling is df and self._entries.get(key) is entry:
+                        del self._entries[key]
+                continue
+            with self._lock:
+                if entry.spilling is df and self._entries.get(key) is entry:
+                    entry.spill_path, entry.spilling = spill_path, None
+                    continue
+            os.remove(spill_path)
+
+    @staticmethod
+    def _read_spill(spill_path: str) -> pd.DataFrame:
+        """ディスクに退避したデータセットを読み戻す"""
+        with open(spill_path, "rb") as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def _remove_spill(entry: _Entry) -> None:
+        """退避ファイルを削除する"""
+        if entry.spill_path is not None:
+            try:
+                os.remove(entry.spill_path)
+            except FileNotFoundError:
+                pass
+            entry.spill_path = None
+
+    def clear(self) -> None:
+        """全てのデータセットと退避ファイルを削除する"""
+        with self._lock:
+            keys = list(self._entries)
+            for entry in self._entries.values():
+                self._remove_spill(entry)
+                entry.spilling = None
+            self._entries.clear()
+            if self.on_evict is not None:
+                for key in keys:
+                    self.on_evict(key)
+
+
+class SessionHandle:
+    """セッション終了時（セッション状態の破棄時）にデータセットの参照を解除するためのハンドル"""
+
+    def __init__(self, store: DatasetStore, session_id: str):
+        self.session_id = session_id
+        weakref.finalize(self, store.release_session, session_id)
@@ -0,0 +1,320 @@
+"""
+フィルタ式エンジン
+`売上 > 100000 and 地域 in ['東京', '大阪']` のような条件式を解析し、
+ベクトル演算で行マスクを作成する。部分式ごとのマスクをキャッシュするため、
+1つの条件だけを変更した場合は残りの条件のマスクが再利用される
+"""
+
+import ast
+import operator
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# キャッシュするマスクの合計サイズの上限（バイト）
+MASK_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# 空白や記号を含む列名は `列名` のようにバッククォートで囲んで指定する
+_BACKTICK_PATTERN = re.compile(r"`([^`]+)`")
+_PLACEHOLDER_PREFIX = "__col_"
+
+_COMPARE_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+# 使用できる関数: 関数名 -> 引数の数
+_FUNCTIONS = {
+    "isnull": 1,
+    "notnull": 1,
+    "contains": 2,
+    "startswith": 2,
+}
+
+
+class FilterExpressionError(ValueError):
+    """フィルタ式の構文や列名が不正な場合の例外"""
+
+
+class MaskCache:
+    """部分式ごとの行マスクを保持するLRUキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, max_bytes: int = MASK_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._masks: "OrderedDict[Tuple[Hashable, str], np.ndarray]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[Hashable, str]) -> Optional[np.ndarray]:
+        """キャッシュ済みのマスクを取得する"""
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+            return mask
+
+    def put(self, key: Tuple[Hashable, str], mask: np.ndarray) -> None:
+        """マスクを登録し、上限を超えた分を古い順に破棄する"""
+        mask.flags.writeable = False
+        with self._lock:
+            if key in self._masks:
+                return
+            self._masks[key] = mask
+            self._nbytes += mask.nbytes
+            while self._nbytes > self.max_bytes and len(self._masks) > 1:
+                _, evicted = self._masks.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+
+    def discard(self, dataset_key: Hashable) -> None:
+        """データセットのマスクを全て破棄する"""
+        with self._lock:
+            for key in [key for key in self._masks if key[0] == dataset_key]:
+                self._nbytes -= self._masks.pop(key).nbytes
+
+    def clear(self) -> None:
+        """キャッシュを空にする"""
+        with self._lock:
+            self._masks.clear()
+            self._nbytes = 0
+
+
+# プロセス全体で共有するマスクキャッシュ
+_MASK_CACHE = MaskCache()
+
+
+def discard_masks(dataset_key: Hashable) -> None:
+    """共有キャッシュからデータセットのマスクを破棄する（データセットの退避・破棄時に呼び出す）"""
+    _MASK_CACHE.discard(dataset_key)
+
+
+def _quote_columns(expression: str) -> Tuple[str, Dict[str, str]]:
+    """バッククォートで囲まれた列名をPythonの識別子に置き換える"""
+    aliases: Dict[str, str] = {}
+
+    def replace(match: "re.Match[str]") -> str:
+        alias = f"{_PLACEHOLDER_PREFIX}{len(aliases)}"
+        aliases[alias] = match.group(1)
+        return alias
+
+    return _BACKTICK_PATTERN.sub(replace, expression), aliases
+
+
+def parse_filter(expression: str, columns: List[str]) -> ast.expr:
+    """フィルタ式を解析し、列名を検証した構文木を返す"""
+    source, aliases = _quote_columns(expression.strip())
+    try:
+        tree = ast.parse(source, mode="eval").body
+    except SyntaxError as e:
+        raise FilterExpressionError(f"フィルタ式の構文が正しくありません: {e.msg}") from e
+
+    column_set = set(columns)
+    tree = _ColumnResolver(aliases).visit(tree)
+    _validate(tree, column_set)
+    return tree
+
+
+class _ColumnResolver(ast.NodeTransformer):
+    """識別子を列名を表すName節点に変換する（バッククォートの置き換えを元に戻す）"""
+
+    def __init__(self, aliases: Dict[str, str]):
+        self.aliases = aliases
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        return ast.copy_location(ast.Name(id=self.aliases.get(node.id, node.id), ctx=ast.Load()), node)
+
+
+def _validate(node: ast.AST, columns: set) -> None:
+    """使用可能な構文と列名のみで構成されているか検証する"""
+    if isinstance(node, ast.BoolOp):
+        for value in node.values:
+            _validate(value, columns)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        _validate(node.operand, columns)
+    elif isinstance(node, ast.Compare):
+        for op in node.ops:
+            if type(op) not in _COMPARE_OPS and not isinstance(op, (ast.In, ast.NotIn)):
+                raise FilterExpressionError(f"使用できない比較演算子です: {type(op).__name__}")
+        operands = [node.left] + node.comparators
+        for op, operand in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)) and not isinstance(operand, (ast.List, ast.Tuple, ast.Set)):
+                raise FilterExpressionError("in の右辺には ['A', 'B'] のようなリストを指定してください")
+        for operand in operands:
+            _validate_operand(operand, columns)
+        if not any(isinstance(operand, ast.Name) for operand in operands):
+            raise FilterExpressionError("比較式には列名を少なくとも1つ含めてください")
+    elif isinstance(node, ast.Call):
+        _validate_call(node, columns)
+    else:
+        raise FilterExpressionError(f"条件として使用できない式です: {ast.unparse(node)}")
+
+
+def _validate_operand(node: ast.AST, columns: set) -> None:
+    """比較式の左辺・右辺を検証する"""
+    if isinstance(node, ast.Name):
+        if node.id not in columns:
+            raise FilterExpressionError(f"列 '{node.id}' が見つかりません")
+    elif isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        for element in node.elts:
+            if not isinstance(element, ast.Constant):
+                raise FilterExpressionError("リストには定数のみ指定できます")
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+        return
+    elif not isinstance(node, ast.Constant):
+        raise FilterExpressionError(f"比較に使用できない値です: {ast.unparse(node)}")
+
+
+def _validate_call(node: ast.Call, columns: set) -> None:
+    """関数呼び出し（isnull, contains など）を検証する"""
+    name = node.func.id if isinstance(node.func, ast.Name) else None
+    if name not in _FUNCTIONS:
+        raise FilterExpressionError(f"使用できない関数です: {ast.unparse(node.func)}（使用可能: {', '.join(_FUNCTIONS)}）")
+    if len(node.args) != _FUNCTIONS[name] or node.keywords:
+        raise FilterExpressionError(f"{name} の引数の数が正しくありません")
+    column_arg = node.args[0]
+    if not isinstance(column_arg, ast.Name) or column_arg.id not in columns:
+        raise FilterExpressionError(f"{name} の第1引数には列名を指定してください")
+    if len(node.args) == 2 and not (isinstance(node.args[1], ast.Constant) and isinstance(node.args[1].value, str)):
+        raise FilterExpressionError(f"{name} の第2引数には文字列を指定してください")
+
+
+def referenced_columns(tree: ast.AST) -> List[str]:
+    """構文木で参照されている列名を返す"""
+    # 関数名を表すName節点は列名ではないため除外する
+    function_names = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and id(node) not in function_names and node.id not in names:
+            names.append(node.id)
+    return names
+
+
+def evaluate_filter(df: pd.DataFrame, expression: str, dataset_key: Optional[Hashable] = None,
+                    cache: Optional[MaskCache] = _MASK_CACHE) -> np.ndarray:
+    """フィルタ式を評価し、条件を満たす行をTrueとするマスクを返す
+
+    dataset_key を指定すると、同じデータセットに対する部分式のマスクがキャッシュから再利用される
+    """
+    tree = parse_filter(expression, df.columns.tolist())
+    use_cache = cache if dataset_key is not None else None
+    return _evaluate(df, tree, dataset_key, use_cache)
+
+
+def _evaluate(df: pd.DataFrame, node: ast.AST, dataset_key: Optional[Hashable], cache: Optional[MaskCache]) -> np.ndarray:
+    """構文木を再帰的に評価する（部分式ごとにキャッシュを参照）"""
+    key = (dataset_key, ast.unparse(node))
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    if isinstance(node, ast.BoolOp):
+        masks = [_evaluate(df, value, dataset_key, cache) for value in node.values]
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        mask = combine.reduce(masks)
+    elif isinstance(node, ast.UnaryOp):
+        mask = ~_evaluate(df, node.operand, dataset_key, cache)
+    elif isinstance(node, ast.Compare):
+        mask = _evaluate_compare(df, node)
+    else:
+        mask = _evaluate_call(df, node)
+
+    mask = np.asarray(mask, dtype=bool)
+    if cache is not None:
+        cache.put(key, mask)
+    return mask
+
+
+def _operand_value(df: pd.DataFrame, node: ast.AST):
+    """比較式の左辺・右辺の値を取得する（列はSeries、定数はスカラー）"""
+    if isinstance(node, ast.Name):
+        return df[node.id]
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return [element.value for element in node.elts]
+    return ast.literal_eval(node)
+
+
+def _coerce_constant(series: pd.Series, value):
+    """日時列と比較する文字列定数を日時に変換する"""
+    if isinstance(value, str) and pd.api.types.is_datetime64_any_dtype(series.dtype):
+        try:
+            timestamp = pd.Timestamp(value)
+        except ValueError as e:
+            raise FilterExpressionError(f"日時として解釈できません: {value}") from e
+        tz = getattr(series.dtype, "tz", None)
+        if tz is not None and timestamp.tzinfo is None:
+            timestamp = timestamp.tz_localize(tz)
+        return timestamp
+    return value
+
+
+def _evaluate_compare(df: pd.DataFrame, node: ast.Compare) -> np.ndarray:
+    """比較式（連続比較 a < 列 < b を含む）を評価する"""
+    mask = None
+    left_node = node.left
+    for op, right_node in zip(node.ops, node.comparators):
+        left = _operand_value(df, left_node)
+        right = _operand_value(df, right_node)
+        if isinstance(left, pd.Series) and not isinstance(right, pd.Series):
+            right = _coerce_constant(left, right)
+        elif isinstance(right, pd.Series) and not isinstance(left, pd.Series):
+            left = _coerce_constant(right, left)
+
+        if isinstance(op, (ast.In, ast.NotIn)):
+            values = [_coerce_constant(left, value) for value in right]
+            result = left.isin(values)
+            if isinstance(op, ast.NotIn):
+                result = ~result & left.notna()
+        else:
+            try:
+                result = _COMPARE_OPS[type(op)](left, right)
+            except TypeError as e:
+                raise FilterExpressionError(f"型が異なる値は比較できません: {ast.unparse(node)}") from e
+
+        if isinstance(result, pd.Series):
+            # 欠損値との比較はFalseとして扱う
+            result = result.fillna(False)
+        result = np.asarray(result, dtype=bool)
+        mask = result if mask is None else mask & result
+        left_node = right_node
+    return mask
+
+
+def _is_arrow_string(dtype) -> bool:
+    """Arrow形式（ArrowDtype・string[pyarrow]）の文字列型かどうか"""
+    if isinstance(dtype, pd.ArrowDtype):
+        import pyarrow as pa
+        return pa.types.is_string(dtype.pyarrow_dtype) or pa.types.is_large_string(dtype.pyarrow_dtype)
+    return isinstance(dtype, pd.StringDtype) and dtype.storage == "pyarrow"
+
+
+def _evaluate_call(df: pd.DataFrame, node: ast.Call) -> np.ndarray:
+    """関数呼び出しを評価する"""
+    name = node.func.id
+    series = df[node.args[0].id]
+    if name == "isnull":
+        return series.isna().to_numpy()
+    if name == "notnull":
+        return series.notna().to_numpy()
+    pattern = node.args[1].value
+    if _is_arrow_string(series.dtype):
+        # Arrow形式の文字列はArrowの計算カーネルで直接照合する（Pythonの文字列に変換しない）
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        values = pa.array(series.array)
+        if name == "contains":
+            matched = pc.match_substring(values, pattern)
+        else:
+            matched = pc.starts_with(values, pattern)
+        return matched.fill_null(False).to_numpy(zero_copy_only=False)
+    text = series.astype("string")
+    if name == "contains":
+        return text.str.contains(pattern, regex=False).fillna(False).to_numpy(dtype=bool)
+    return text.str.startswith(pattern).fillna(False).to_numpy(dtype=bool)
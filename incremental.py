@@ -0,0 +1,138 @@
+"""
+追記されたファイルの検出
+読み込んだファイルのバージョンごとに内容のハッシュ値を記録しておき、新しいファイルの先頭部分の
+ハッシュ値がいずれかのバージョンと一致する（末尾に行が追記されただけの）場合はそのバージョンを返す。
+各バージョンの集計結果（DatasetProfile）は追記された行だけで更新して引き継ぎ、引き継いだ以前のバージョンの集計結果は破棄する
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+import pandas as pd
+
+from config import FILE_VERSION_HISTORY, STREAMING_CHUNK_SIZE
+from loaders import fingerprint_with_prefixes
+from streaming_stats import DatasetProfile
+
+
+class FileVersion:
+    """読み込んだファイルの1バージョン分の情報"""
+
+    def __init__(self, dataset_key: str, content: bytes, content_digest: str, columns: Optional[List[str]],
+                 dtype_backend: Optional[str], previous_key: Optional[str] = None):
+        self.dataset_key = dataset_key
+        self.length = len(content)
+        self.content_digest = content_digest
+        # 最終行が改行で終わっていれば、以降に追記された内容は新しい行として読み込める
+        self.ends_with_newline = content.endswith((b"\n", b"\r"))
+        self.columns = list(columns) if columns else None
+        self.dtype_backend = dtype_backend
+        self.previous_key = previous_key
+        self.rows: Optional[int] = None
+        # 追記された行だけを解析して読み込んだ場合の追記行数
+        self.appended_rows: Optional[int] = None
+        self.profile: Optional[DatasetProfile] = None
+        # 集計結果を新しいバージョンに引き継いだ（このバージョンでは集計し直さない）かどうか
+        self.profile_superseded = False
+
+    def can_append(self, content: bytes, columns: Optional[List[str]], dtype_backend: Optional[str]) -> bool:
+        """新しいファイルがこのバージョンへの追記でありうるか（ハッシュ値の照合前の確認）"""
+        if len(content) <= self.length:
+            return False
+        if (list(columns) if columns else None) != self.columns or dtype_backend != self.dtype_backend:
+            return False
+        return self.ends_with_newline or content[self.length:self.length + 1] in (b"\n", b"\r")
+
+
+class VersionIndex:
+    """ファイルのバージョン履歴（プロセス内の全セッションで共有、スレッドセーフ）"""
+
+    def __init__(self, max_versions: int = FILE_VERSION_HISTORY):
+        self.max_versions = max_versions
+        self._versions: "OrderedDict[str, FileVersion]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def identify(self, content: bytes, columns: Optional[List[str]] = None,
+                 dtype_backend: Optional[str] = None) -> Tuple[str, str, Optional[FileVersion]]:
+        """データセットのキー・内容のハッシュ値と、新しいファイルの先頭と内容が一致する以前のバージョンを返す
+
+        ハッシュ値はファイル全体を1回読む間に各バージョンの長さの位置でも取り出して照合する。
+        一致するバージョンが複数ある場合は最も新しい（長い）ものを返す
+        """
+        with self._lock:
+            candidates = [version for version in self._versions.values()
+                          if version.can_append(content, columns, dtype_backend)]
+        dataset_key, content_digest, prefixes = fingerprint_with_prefixes(
+            content, [version.length for version in candidates], columns, dtype_backend
+        )
+        matches = [version for version in candidates if prefixes.get(version.length) == version.content_digest]
+        previous = max(matches, key=lambda version: version.length, default=None)
+        return dataset_key, content_digest, previous
+
+    def register(self, version: FileVersion) -> FileVersion:
+        """バージョンを履歴に登録する（登録済みならそれを返す）。上限を超えた分は古い順に破棄する"""
+        with self._lock:
+            registered = self._versions.get(version.dataset_key)
+            if registered is not None:
+                self._versions.move_to_end(version.dataset_key)
+                return registered
+            self._versions[version.dataset_key] = version
+            while len(self._versions) > self.max_versions:
+                self._versions.popitem(last=False)
+            return version
+
+    def get(self, dataset_key: str) -> Optional[FileVersion]:
+        """登録済みのバージョンを取得する"""
+        with self._lock:
+            return self._versions.get(dataset_key)
+
+    def profile(self, dataset_key: str) -> Optional[DatasetProfile]:
+        """作成済みのデータセット全体の集計結果を取得する（未登録・未作成の場合はNone、集計は行わない）"""
+        version = self.get(dataset_key)
+        return version.profile if version is not None else None
+
+    def needs_profile(self, dataset_key: str) -> bool:
+        """登録済みで、集計結果が未作成のデータセットかどうか"""
+        version = self.get(dataset_key)
+        return version is not None and version.profile is None and not version.profile_superseded
+
+    def profile_bytes(self) -> int:
+        """保持している集計結果のうち、行数に比例する配列のバイト数"""
+        with self._lock:
+            profiles = [version.profile for version in self._versions.values() if version.profile is not None]
+        return sum(profile.nbytes for profile in profiles)
+
+    def build_profile(self, dataset_key: str, df: pd.DataFrame,
+                      progress: Optional[Callable[[float, Optional[str]], None]] = None) -> Optional[DatasetProfile]:
+        """データセット全体の集計結果を作成して記録する（未登録のデータセットはNone）
+
+        以前のバージョンの集計結果があれば追記された行だけで更新して引き継ぎ、なければ全行をチャンク単位で集計する。
+        全行の集計は時間がかかるため、バックグラウンドジョブから呼び出す（progress には進捗を報告する関数を渡す）
+        """
+        version = self.get(dataset_key)
+        if version is None:
+            return None
+        if version.profile is not None:
+            return version.profile
+        previous = self.get(version.previous_key) if version.previous_key else None
+        profile = previous.profile if previous is not None else None
+        inherited = (profile is not None and profile.rows == previous.rows and profile.rows <= len(df)
+                     and profile.dtypes.equals(df.dtypes))
+        if inherited:
+            # 以前のバージョンを表示中のセッションに影響しないよう、複製してから追記された行を加える
+            profile = profile.copy()
+        else:
+            numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
+            categorical_cols = df.select_dtypes(include=["object", "string", "category"]).columns.tolist()
+            profile = DatasetProfile(numeric_cols, categorical_cols)
+        for start in range(profile.rows, len(df), STREAMING_CHUNK_SIZE):
+            if progress is not None:
+                progress(start / len(df), f"{start:,}行を集計済み")
+            profile.update(df.iloc[start:start + STREAMING_CHUNK_SIZE])
+        version.profile = profile
+        if inherited:
+            # 行ごとのハッシュ値を系列内で重複して保持しないよう、最新のバージョンの集計結果だけを残す
+            previous.profile = None
+            previous.profile_superseded = True
+        return profile
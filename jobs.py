@@ -0,0 +1,143 @@
+"""
+バックグラウンドジョブ実行処理
+時間のかかる分析を (データセット, パラメータ) をキーとしたジョブとしてスレッドプールで実行する。
+同じキーのジョブは実行中・完了済みのものを共有し、進捗の報告とキャンセルに対応する
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+# ジョブの状態
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """ジョブがキャンセルされたことを示す例外"""
+
+
+class JobContext:
+    """ジョブ関数に渡される進捗報告・キャンセル確認用のオブジェクト"""
+
+    def __init__(self, job: "Job"):
+        self._job = job
+
+    @property
+    def cancelled(self) -> bool:
+        """キャンセルが要求されているかどうか"""
+        return self._job.cancel_event.is_set()
+
+    def report(self, progress: float, message: Optional[str] = None) -> None:
+        """進捗（0.0〜1.0）を報告する。キャンセルが要求されていればJobCancelledを送出する"""
+        if self.cancelled:
+            raise JobCancelled()
+        self._job.progress = min(max(progress, 0.0), 1.0)
+        if message is not None:
+            self._job.message = message
+
+
+class Job:
+    """1件のジョブの状態と結果"""
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.status = PENDING
+        self.progress = 0.0
+        self.message = ""
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.subscribers: set = set()
+        self.cancel_event = threading.Event()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        """完了・失敗・キャンセルのいずれかで終了しているかどうか"""
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def elapsed(self) -> float:
+        """実行開始からの経過秒数"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class JobExecutor:
+    """キーで重複を排除しながらジョブを実行するスレッドプール"""
+
+    def __init__(self, max_workers: int = 4, max_results: int = 64):
+        self.max_results = max_results
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._jobs: "OrderedDict[Hashable, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key: Hashable, func: Callable[[JobContext], Any], subscriber: Hashable = None) -> Job:
+        """ジョブを投入する。同じキーの実行中・完了済みジョブがあればそれを返す
+
+        func は JobContext を1つ受け取る関数。subscriber にはジョブを待っているセッションなどを指定する
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job.status in (FAILED, CANCELLED):
+                job = Job(key)
+                self._jobs[key] = job
+                self._pool.submit(self._run, job, func)
+                self._trim()
+            self._jobs.move_to_end(key)
+            if subscriber is not None:
+                job.subscribers.add(subscriber)
+            return job
+
+    def get(self, key: Hashable) -> Optional[Job]:
+        """キーに対応するジョブを取得する"""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def unsubscribe(self, key: Hashable, subscriber: Hashable) -> None:
+        """ジョブの待機を解除し、誰も待っていない未完了のジョブはキャンセルする
+
+        ジョブは複数のセッションで共有されるため、1つのセッションのキャンセル操作もこの待機の解除として扱う。
+        実行中のジョブは次の進捗報告で停止する
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return
+            job.subscribers.discard(subscriber)
+            if not job.subscribers and not job.finished:
+                job.cancel_event.set()
+                if job.status == PENDING:
+                    job.status = CANCELLED
+
+    def _run(self, job: Job, func: Callable[[JobContext], Any]) -> None:
+        """ワーカースレッドでジョブを実行する"""
+        if job.cancel_event.is_set():
+            job.status = CANCELLED
+            return
+        job.status = RUNNING
+        job.started_at = time.monotonic()
+        try:
+            job.result = func(JobContext(job))
+            job.progress = 1.0
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        finally:
+            job.finished_at = time.monotonic()
+
+    def _trim(self) -> None:
+        """保持する終了済みジョブの数を上限内に収める（ロック取得済みで呼び出す）"""
+        finished = [key for key, job in self._jobs.items() if job.finished]
+        for key in finished[:max(0, len(self._jobs) - self.max_results)]:
+            del self._jobs[key]
@@ -0,0 +1,564 @@
+"""
+データファイル読み込み処理
+ファイル形式ごとのローダーを登録し、拡張子に応じて読み込み処理を振り分ける
+"""
+
+import codecs
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import threading
+from io import BytesIO
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from config import ALLOWED_FILE_TYPES, STREAMING_CHUNK_SIZE
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# NDJSONを分割して読み込む際の1チャンクあたりの行数
+JSON_CHUNK_SIZE = 100_000
+
+# Arrow形式で読み込む場合に指定するdtype_backend
+ARROW_DTYPE_BACKEND = "pyarrow"
+
+# CSVの読み込みで試行するエンコーディング（先頭から順に試す）
+CSV_ENCODINGS = ["utf-8", "shift_jis", "cp932"]
+
+# エンコーディングの判定でまとめてデコードするバイト数
+ENCODING_CHECK_BLOCK_SIZE = 1024 * 1024
+
+# 日時列の判定に使用するサンプル数
+DATETIME_SAMPLE_SIZE = 100
+
+_DIGIT_PATTERN = re.compile(r"\d")
+
+# 日時書式の推定結果を保持する件数の上限
+DATETIME_FORMAT_CACHE_SIZE = 1024
+
+# 文字列の形 -> 推定した日時書式
+_DATETIME_FORMAT_CACHE: Dict[str, Optional[str]] = {}
+# 複数セッションのスクリプトスレッド・ジョブから同時に参照されるため、更新はロック内で行う
+_DATETIME_FORMAT_LOCK = threading.Lock()
+
+LoaderFunc = Callable[[bytes, Optional[List[str]], Optional[str]], Tuple[pd.DataFrame, Optional[str]]]
+SchemaFunc = Callable[[bytes], List[str]]
+ChunkFunc = Callable[[bytes, Optional[List[str]], int], Iterator[pd.DataFrame]]
+
+# 拡張子 -> ローダー情報
+_LOADERS: Dict[str, Dict] = {}
+
+
+def register_loader(file_type: str, extensions: List[str], schema_reader: Optional[SchemaFunc] = None,
+                    chunk_reader: Optional[ChunkFunc] = None):
+    """ファイル形式のローダーを登録するデコレータ
+
+    chunk_reader を指定した形式は iter_dataframe_chunks でチャンク単位に読み込める
+    """
+    def decorator(func: LoaderFunc) -> LoaderFunc:
+        for ext in extensions:
+            _LOADERS[ext] = {
+                "file_type": file_type,
+                "loader": func,
+                "schema_reader": schema_reader,
+                "chunk_reader": chunk_reader,
+            }
+        return func
+    return decorator
+
+
+def get_extension(file_name: str) -> str:
+    """ファイル名から小文字の拡張子（ドットなし）を取得する"""
+    return os.path.splitext(file_name)[1].lstrip(".").lower()
+
+
+def get_supported_extensions() -> List[str]:
+    """ALLOWED_FILE_TYPESで許可され、ローダーが登録されている拡張子の一覧を返す"""
+    allowed = {file_type.strip().lower() for file_type in ALLOWED_FILE_TYPES}
+    return [ext for ext, entry in _LOADERS.items() if entry["file_type"] in allowed]
+
+
+def _get_entry(file_name: str) -> Dict:
+    """ファイル名に対応するローダー情報を取得する"""
+    ext = get_extension(file_name)
+    if ext not in get_supported_extensions():
+        raise ValueError(f"対応していないファイル形式です: .{ext}")
+    return _LOADERS[ext]
+
+
+def read_column_names(content: bytes, file_name: str) -> List[str]:
+    """データ本体を読み込まずに列名の一覧を取得する"""
+    entry = _get_entry(file_name)
+    if entry["schema_reader"] is None:
+        return []
+    return [str(col) for col in entry["schema_reader"](content)]
+
+
+def supports_column_projection(file_name: str) -> bool:
+    """読み込む列を事前に絞り込めるファイル形式かどうか"""
+    return _get_entry(file_name)["schema_reader"] is not None
+
+
+def _finish_fingerprint(digest, columns: Optional[List[str]], dtype_backend: Optional[str]) -> str:
+    """ファイル内容のハッシュに読み込む列・データ型の形式を加えてキーにする"""
+    if columns:
+        digest.update("\x1f".join(columns).encode("utf-8"))
+    if dtype_backend:
+        digest.update(f"\x1e{dtype_backend}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def dataset_fingerprint(content: bytes, columns: Optional[List[str]] = None,
+                        dtype_backend: Optional[str] = None) -> str:
+    """ファイル内容・読み込む列・データ型の形式からデータセットを識別するキーを生成する"""
+    return _finish_fingerprint(hashlib.blake2b(content, digest_size=16), columns, dtype_backend)
+
+
+def fingerprint_with_prefixes(content: bytes, prefix_lengths: List[int], columns: Optional[List[str]] = None,
+                              dtype_backend: Optional[str] = None) -> Tuple[str, str, Dict[int, str]]:
+    """データセットのキーと、ファイル内容全体・指定した長さの先頭部分のハッシュ値を1パスで計算する
+
+    戻り値は (dataset_fingerprint と同じキー, 内容全体のハッシュ値, 先頭のバイト数 -> そこまでのハッシュ値)
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    view = memoryview(content)
+    position = 0
+    prefixes = {}
+    for length in sorted({length for length in prefix_lengths if 0 < length <= len(content)}):
+        digest.update(view[position:length])
+        position = length
+        prefixes[length] = digest.copy().hexdigest()
+    digest.update(view[position:])
+    content_digest = digest.hexdigest()
+    return _finish_fingerprint(digest, columns, dtype_backend), content_digest, prefixes
+
+
+def _infer_datetime_format(value: str) -> Optional[str]:
+    """日時文字列の書式を推定する
+
+    数字を0に置き換えた形が同じ文字列は推定結果を共有する（例: 2023-01-01 と 2024-12-31）
+    """
+    shape = _DIGIT_PATTERN.sub("0", value)
+    with _DATETIME_FORMAT_LOCK:
+        if shape in _DATETIME_FORMAT_CACHE:
+            return _DATETIME_FORMAT_CACHE[shape]
+    fmt = guess_datetime_format(value)
+    # 年と月を含まない書式（数字だけのIDなど）は日時とみなさない
+    if fmt is not None and ("%Y" not in fmt or not any(code in fmt for code in ("%m", "%b", "%B"))):
+        fmt = None
+    with _DATETIME_FORMAT_LOCK:
+        if len(_DATETIME_FORMAT_CACHE) >= DATETIME_FORMAT_CACHE_SIZE:
+            _DATETIME_FORMAT_CACHE.clear()
+        _DATETIME_FORMAT_CACHE[shape] = fmt
+    return fmt
+
+
+def parse_datetime_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """日時を表す文字列の列を自動検出し、datetime型に変換する
+
+    先頭のサンプルから書式を推定して書式指定で一括変換する。
+    1件でも変換できない値があれば元の列のまま残す
+    """
+    for col in df.select_dtypes(include=["object", "string"]).columns:
+        series = df[col]
+        sample = series.dropna().head(DATETIME_SAMPLE_SIZE)
+        if sample.empty or not all(isinstance(value, str) for value in sample):
+            continue
+        fmt = _infer_datetime_format(sample.iloc[0])
+        if fmt is None:
+            continue
+        if pd.to_datetime(sample, format=fmt, errors="coerce").isna().any():
+            continue
+        parsed = pd.to_datetime(series, format=fmt, errors="coerce")
+        if parsed.notna().sum() == series.notna().sum():
+            df[col] = parsed
+    return df
+
+
+def _arrow_datetimes_to_numpy(df: pd.DataFrame) -> pd.DataFrame:
+    """Arrow形式の日付・日時列をdatetime64型に変換する
+
+    リサンプリングや期間の絞り込みはDatetimeIndexを前提とするため、日時列のみNumPy形式に揃える
+    """
+    arrow_cols = [col for col in df.columns if isinstance(df[col].dtype, pd.ArrowDtype)]
+    if not arrow_cols:
+        return df
+    import pyarrow as pa
+    for col in arrow_cols:
+        arrow_type = df[col].dtype.pyarrow_dtype
+        if pa.types.is_date(arrow_type):
+            df[col] = df[col].astype("datetime64[ns]")
+        elif pa.types.is_timestamp(arrow_type):
+            target = pd.DatetimeTZDtype("ns", arrow_type.tz) if arrow_type.tz else "datetime64[ns]"
+            df[col] = df[col].astype(target)
+    return df
+
+
+def normalize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """全ファイル形式共通のデータ型の後処理"""
+    # Excelやjsonでは列名が数値になる場合があるため文字列に揃える
+    df.columns = [str(col) for col in df.columns]
+    return parse_datetime_columns(_arrow_datetimes_to_numpy(df))
+
+
+def _backend_options(dtype_backend: Optional[str]) -> Dict[str, str]:
+    """pandasの読み込み関数に渡すdtype_backendの指定（未指定の場合は従来のNumPy形式）"""
+    return {"dtype_backend": dtype_backend} if dtype_backend else {}
+
+
+def load_dataframe(content: bytes, file_name: str, columns: Optional[List[str]] = None,
+                   dtype_backend: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[str]]:
+    """ファイル形式に応じたローダーでデータを読み込む
+
+    dtype_backend に "pyarrow" を指定すると、文字列を含む全ての列をArrow形式（string[pyarrow]など）で保持する。
+    戻り値は (DataFrame, エンコーディング)。バイナリ形式の場合エンコーディングはNone
+    """
+    entry = _get_entry(file_name)
+    df, encoding = entry["loader"](content, list(columns) if columns else None, dtype_backend)
+    return normalize_dtypes(df), encoding
+
+
+def _align_chunk_column(values: pd.Series, dtype, datetime_format: Optional[str] = None) -> pd.Series:
+    """チャンクの列を先頭のチャンクで決まったデータ型に揃える（変換できない値は欠損値とする）"""
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        if not pd.api.types.is_datetime64_any_dtype(values):
+            values = pd.to_datetime(values, format=datetime_format or "mixed", errors="coerce")
+        return values.astype(dtype)
+    if pd.api.types.is_bool_dtype(dtype):
+        # 欠損値を含む真偽値の列はそのまま残す
+        return values
+    if pd.api.types.is_numeric_dtype(dtype):
+        # 整数の列に欠損値が現れた場合は、全体を読み込んだ場合と同じく浮動小数点数のままとする
+        return values if pd.api.types.is_numeric_dtype(values) else pd.to_numeric(values, errors="coerce")
+    if pd.api.types.is_object_dtype(dtype):
+        return values.astype(str).where(values.notna()).astype(object)
+    return values.astype(dtype)
+
+
+def normalize_chunks(chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """チャンクごとのデータ型の後処理
+
+    日時列の判定などは先頭のチャンクだけで行い、2つ目以降のチャンクは先頭のチャンクのデータ型に揃える
+    （チャンクごとに判定すると、同じ列でもチャンクによってデータ型が変わるため）
+    """
+    dtypes = None
+    formats: Dict[str, Optional[str]] = {}
+    for chunk in chunks:
+        if dtypes is None:
+            # 日時に変換された列は、先頭のチャンクと同じ書式で以降のチャンクを変換する
+            for col in chunk.select_dtypes(include=["object", "string"]).columns:
+                sample = chunk[col].dropna()
+                formats[str(col)] = _infer_datetime_format(str(sample.iloc[0])) if len(sample) > 0 else None
+            chunk = normalize_dtypes(chunk)
+            dtypes = chunk.dtypes
+        else:
+            chunk.columns = [str(col) for col in chunk.columns]
+            chunk = _arrow_datetimes_to_numpy(chunk)
+            for col, dtype in dtypes.items():
+                if col in chunk.columns and chunk[col].dtype != dtype:
+                    chunk[col] = _align_chunk_column(chunk[col], dtype, formats.get(col))
+        yield chunk
+
+
+def iter_dataframe_chunks(content: bytes, file_name: str, columns: Optional[List[str]] = None,
+                          chunksize: int = STREAMING_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """ファイルをチャンク単位で読み込む（全てのチャンクを先頭のチャンクと同じデータ型に揃える）
+
+    チャンク読み込みに対応していない形式（Excelなど）は全体を読み込んでから分割する
+    """
+    entry = _get_entry(file_name)
+    columns = list(columns) if columns else None
+    if entry["chunk_reader"] is not None:
+        chunks = entry["chunk_reader"](content, columns, chunksize)
+    else:
+        df, _ = entry["loader"](content, columns, None)
+        chunks = (df.iloc[start:start + chunksize].copy() for start in range(0, len(df), chunksize))
+    yield from normalize_chunks(chunks)
+
+
+# ---- CSV ----
+
+def _read_csv_header(content: bytes) -> List[str]:
+    """CSVのヘッダー行のみを読み込む"""
+    for encoding in CSV_ENCODINGS:
+        try:
+            return pd.read_csv(BytesIO(content), encoding=encoding, nrows=0).columns.tolist()
+        except UnicodeDecodeError:
+            continue
+    return []
+
+
+def _detect_csv_encoding(content: bytes) -> str:
+    """CSVのエンコーディングを判定する（ファイル全体を一度に文字列化しないよう分割してデコード）"""
+    for encoding in CSV_ENCODINGS[:-1]:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            for start in range(0, len(content), ENCODING_CHECK_BLOCK_SIZE):
+                decoder.decode(content[start:start + ENCODING_CHECK_BLOCK_SIZE])
+            decoder.decode(b"", final=True)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return CSV_ENCODINGS[-1]
+
+
+def _iter_csv_chunks(content: bytes, columns: Optional[List[str]], chunksize: int) -> Iterator[pd.DataFrame]:
+    """CSVをチャンク単位で読み込む
+
+    先頭のチャンクで文字列だった列は、以降のチャンクでも "001" のような値が数値にならないよう文字列として読み込む
+    """
+    encoding = _detect_csv_encoding(content)
+    first = pd.read_csv(BytesIO(content), encoding=encoding, usecols=columns, nrows=chunksize)
+    text_dtypes = {col: str for col, dtype in first.dtypes.items() if pd.api.types.is_object_dtype(dtype)}
+    with pd.read_csv(BytesIO(content), encoding=encoding, usecols=columns, chunksize=chunksize,
+                     dtype=text_dtypes) as reader:
+        yield from reader
+
+
+@register_loader("csv", ["csv"], schema_reader=_read_csv_header, chunk_reader=_iter_csv_chunks)
+def load_csv(content: bytes, columns: Optional[List[str]],
+             dtype_backend: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[str]]:
+    """CSVを読み込む（UTF-8、Shift_JIS、CP932の順に試行）"""
+    if dtype_backend == ARROW_DTYPE_BACKEND:
+        # Arrowのマルチスレッドパーサーで読み込み、Pythonオブジェクトを経由せずにArrow配列を保持する
+        encoding = _detect_csv_encoding(content)
+        df = pd.read_csv(BytesIO(content), encoding=encoding, usecols=columns,
+                         engine="pyarrow", dtype_backend=dtype_backend)
+        return df, encoding
+    for encoding in CSV_ENCODINGS[:-1]:
+        try:
+            return pd.read_csv(BytesIO(content), encoding=encoding, usecols=columns), encoding
+        except UnicodeDecodeError:
+            continue
+    encoding = CSV_ENCODINGS[-1]
+    return pd.read_csv(BytesIO(content), encoding=encoding, usecols=columns), encoding
+
+
+def supports_append(file_name: str) -> bool:
+    """末尾に追記された行だけを読み込めるファイル形式かどうか"""
+    return _get_entry(file_name)["file_type"] == "csv"
+
+
+def _align_tail_column(tail: pd.Series, previous: pd.Series) -> Optional[pd.Series]:
+    """追記された行の列を前回のデータ型に揃える（全体を読み込み直した場合と型が変わる場合はNone）"""
+    if tail.dtype == previous.dtype:
+        return tail
+    if tail.isna().all():
+        # 欠損値だけの列は読み込み時にfloat型になるため、前回の型の欠損値に揃える
+        if pd.api.types.is_datetime64_any_dtype(previous):
+            return pd.to_datetime(tail)
+        return tail.astype(previous.dtype) if not pd.api.types.is_numeric_dtype(previous) else tail
+    if pd.api.types.is_datetime64_any_dtype(previous):
+        if pd.api.types.is_datetime64_any_dtype(tail):
+            return tail
+        values = tail.dropna()
+        fmt = _infer_datetime_format(str(values.iloc[0]))
+        if fmt is None:
+            return None
+        parsed = pd.to_datetime(tail, format=fmt, errors="coerce")
+        return parsed if parsed.notna().sum() == len(values) else None
+    if pd.api.types.is_bool_dtype(previous) or pd.api.types.is_bool_dtype(tail):
+        return None
+    if pd.api.types.is_numeric_dtype(previous) and pd.api.types.is_numeric_dtype(tail):
+        # int と float の違いは結合時に全体を読み込んだ場合と同じく float に揃う
+        return tail
+    return None
+
+
+def load_csv_tail(content: bytes, offset: int, previous: pd.DataFrame, encoding: Optional[str],
+                  columns: Optional[List[str]] = None, dtype_backend: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """CSVの offset バイト目以降に追記された行だけを読み込み、前回読み込んだDataFrameと同じデータ型に揃える
+
+    数値の列に文字列が追記された場合など、全体を読み込み直すとデータ型が変わる場合はNoneを返す
+    """
+    encoding = encoding or CSV_ENCODINGS[0]
+    tail_content = content[offset:]
+    if not tail_content.strip():
+        return previous.iloc[0:0]
+    header = pd.read_csv(BytesIO(content), encoding=encoding, nrows=0).columns.tolist()
+    # 文字列の列は "001" のような値が数値として解釈されないよう、前回と同じ型で読み込む
+    text_dtypes = {
+        col: (str if pd.api.types.is_object_dtype(dtype) else dtype)
+        for col, dtype in previous.dtypes.items()
+        if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+    }
+    options = {"engine": "pyarrow", "dtype_backend": dtype_backend} if dtype_backend == ARROW_DTYPE_BACKEND else {}
+    tail = pd.read_csv(BytesIO(tail_content), encoding=encoding, header=None, names=header,
+                       usecols=list(columns) if columns else None, dtype=text_dtypes, **options)
+    tail = _arrow_datetimes_to_numpy(tail)
+    tail.columns = [str(col) for col in tail.columns]
+    if sorted(tail.columns) != sorted(previous.columns):
+        return None
+    for col in previous.columns:
+        aligned = _align_tail_column(tail[col], previous[col])
+        if aligned is None:
+            return None
+        tail[col] = aligned
+    return tail[previous.columns.tolist()]
+
+
+def append_rows(previous: pd.DataFrame, tail: pd.DataFrame) -> pd.DataFrame:
+    """前回読み込んだDataFrameに追記された行を結合する
+
+    解析は追記された行だけで済むが、結合では前回のDataFrame全体を複製するため全行数に比例する時間とメモリがかかる
+    """
+    if len(tail) == 0:
+        return previous.copy(deep=False)
+    return pd.concat([previous, tail], ignore_index=True)
+
+
+# ---- Excel ----
+
+def calamine_available() -> bool:
+    """python-calamine（高速なExcel読み込みエンジン）がインストールされているかどうか"""
+    return importlib.util.find_spec("python_calamine") is not None
+
+
+def _excel_engine() -> str:
+    """利用可能な最速のExcel読み込みエンジンを返す（calamineがなければopenpyxl）"""
+    return "calamine" if calamine_available() else "openpyxl"
+
+
+def _read_excel_header(content: bytes) -> List[str]:
+    """Excelの先頭シートのヘッダー行のみを読み込む"""
+    return pd.read_excel(BytesIO(content), engine=_excel_engine(), nrows=0).columns.tolist()
+
+
+# 旧形式の .xls は openpyxl では読み込めないため、calamine がある場合のみ受け付ける
+@register_loader("xlsx", ["xlsx", "xls"] if calamine_available() else ["xlsx"], schema_reader=_read_excel_header)
+def load_excel(content: bytes, columns: Optional[List[str]],
+               dtype_backend: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[str]]:
+    """Excelの先頭シートを読み込む"""
+    df = pd.read_excel(BytesIO(content), engine=_excel_engine(), usecols=columns, **_backend_options(dtype_backend))
+    return df, None
+
+
+# ---- JSON / NDJSON ----
+
+def _is_json_lines(content: bytes) -> bool:
+    """1行1レコードのNDJSON形式かどうかを判定する
+
+    先頭行だけで1つのJSONオブジェクトとして完結していればNDJSONとみなす。
+    1行だけの場合は、値が全てスカラー（列ごとの辞書ではない）ときに限り1レコードとみなす
+    """
+    stripped = content.lstrip()
+    if not stripped.startswith(b"{"):
+        return False
+    first_line, _, rest = stripped.partition(b"\n")
+    try:
+        record = json.loads(first_line)
+    except ValueError:
+        # 整形されたJSONオブジェクトなど、先頭行だけでは完結しない
+        return False
+    if not isinstance(record, dict):
+        return False
+    return rest.strip() != b"" or not any(isinstance(value, (dict, list)) for value in record.values())
+
+
+def _read_json_lines(content: bytes, columns: Optional[List[str]],
+                     dtype_backend: Optional[str]) -> Tuple[pd.DataFrame, Optional[str]]:
+    """NDJSONをチャンク単位で読み込んで結合する"""
+    chunks = []
+    with pd.read_json(BytesIO(content), lines=True, chunksize=JSON_CHUNK_SIZE, encoding="utf-8",
+                      **_backend_options(dtype_backend)) as reader:
+        for chunk in reader:
+            chunks.append(chunk.reindex(columns=columns) if columns else chunk)
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+    return df, "utf-8"
+
+
+def _iter_json_lines_chunks(content: bytes, columns: Optional[List[str]], chunksize: int) -> Iterator[pd.DataFrame]:
+    """NDJSONをチャンク単位で読み込む"""
+    with pd.read_json(BytesIO(content), lines=True, chunksize=chunksize, encoding="utf-8") as reader:
+        for chunk in reader:
+            yield chunk.reindex(columns=columns) if columns else chunk
+
+
+def _iter_json_chunks(content: bytes, columns: Optional[List[str]], chunksize: int) -> Iterator[pd.DataFrame]:
+    """JSONをチャンク単位で読み込む（NDJSON以外は全体を読み込んでから分割する）"""
+    if _is_json_lines(content):
+        yield from _iter_json_lines_chunks(content, columns, chunksize)
+        return
+    df, _ = load_json(content, columns, None)
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize].copy()
+
+
+@register_loader("json", ["json"], chunk_reader=_iter_json_chunks)
+def load_json(content: bytes, columns: Optional[List[str]],
+              dtype_backend: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[str]]:
+    """JSONを読み込む（内容がNDJSONの場合はチャンク単位でストリーム処理）"""
+    if _is_json_lines(content):
+        return _read_json_lines(content, columns, dtype_backend)
+    df = pd.read_json(BytesIO(content), encoding="utf-8", **_backend_options(dtype_backend))
+    return (df[columns] if columns else df), "utf-8"
+
+
+@register_loader("json", ["jsonl", "ndjson"], chunk_reader=_iter_json_lines_chunks)
+def load_json_lines(content: bytes, columns: Optional[List[str]],
+                    dtype_backend: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[str]]:
+    """拡張子が .jsonl / .ndjson のファイルを常にNDJSONとして読み込む"""
+    return _read_json_lines(content, columns, dtype_backend)
+
+
+# ---- Parquet / Feather (Arrow) ----
+
+def _read_parquet_schema(content: bytes) -> List[str]:
+    """Parquetのメタデータから列名を取得する"""
+    import pyarrow.parquet as pq
+    return pq.read_schema(BytesIO(content)).names
+
+
+def _iter_parquet_chunks(content: bytes, columns: Optional[List[str]], chunksize: int) -> Iterator[pd.DataFrame]:
+    """Parquetをレコードバッチ単位で読み込む"""
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(BytesIO(content)).iter_batches(batch_size=chunksize, columns=columns):
+        yield batch.to_pandas()
+
+
+def _table_to_pandas(table: "pa.Table", dtype_backend: Optional[str]) -> pd.DataFrame:
+    """Arrowのテーブルを変換する（Arrow形式の場合は列のバッファをコピーせずにそのまま保持する）"""
+    if dtype_backend == ARROW_DTYPE_BACKEND:
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    return table.to_pandas()
+
+
+@register_loader("parquet", ["parquet", "pq"], schema_reader=_read_parquet_schema, chunk_reader=_iter_parquet_chunks)
+def load_parquet(content: bytes, columns: Optional[List[str]],
+                 dtype_backend: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[str]]:
+    """Parquetを読み込む（必要な列のみ読み込む）"""
+    import pyarrow.parquet as pq
+    table = pq.read_table(BytesIO(content), columns=columns)
+    return _table_to_pandas(table, dtype_backend), None
+
+
+def _read_feather_schema(content: bytes) -> List[str]:
+    """Feather(Arrow IPC)のスキーマから列名を取得する"""
+    import pyarrow.ipc as ipc
+    return ipc.open_file(BytesIO(content)).schema.names
+
+
+def _iter_feather_chunks(content: bytes, columns: Optional[List[str]], chunksize: int) -> Iterator[pd.DataFrame]:
+    """Feather(Arrow IPC)をレコードバッチ単位で読み込む"""
+    import pyarrow.ipc as ipc
+    reader = ipc.open_file(BytesIO(content))
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        if columns:
+            batch = batch.select(columns)
+        for start in range(0, batch.num_rows, chunksize):
+            yield batch.slice(start, chunksize).to_pandas()
+
+
+@register_loader("feather", ["feather", "arrow"], schema_reader=_read_feather_schema, chunk_reader=_iter_feather_chunks)
+def load_feather(content: bytes, columns: Optional[List[str]],
+                 dtype_backend: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[str]]:
+    """Feather(Arrow IPC)を読み込む（必要な列のみ読み込む）"""
+    import pyarrow.feather as feather
+    table = feather.read_table(BytesIO(content), columns=columns)
+    return _table_to_pandas(table, dtype_backend), None
@@ -0,0 +1,119 @@
+"""
+ペアプロット用の密度集計処理
+各列を一度だけビン番号に変換し、列の組ごとの2次元ヒストグラム（密度グリッド）と
+対角成分のヒストグラムを全行から集計する。結果の大きさはビン数で決まり、行数に依存しない
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 1列あたりのビン数の既定値
+DEFAULT_BINS = 40
+
+
+def _bin_indices(values: np.ndarray, bins: int) -> Tuple[np.ndarray, np.ndarray]:
+    """値を等幅ビンの番号に変換する（欠損値・無限大は -1）。戻り値は (ビン番号, ビンの境界)"""
+    finite = np.isfinite(values)
+    all_finite = bool(finite.all())
+    if not all_finite and not finite.any():
+        return np.full(len(values), -1, dtype=np.int32), np.linspace(0.0, 1.0, bins + 1)
+    low = values.min() if all_finite else values[finite].min()
+    high = values.max() if all_finite else values[finite].max()
+    if high == low:
+        high = low + 1.0
+    edges = np.linspace(low, high, bins + 1)
+    # 一時配列を増やさないよう、同じ配列の上で変換する
+    scaled = values - low
+    scaled *= bins / (high - low)
+    np.minimum(scaled, bins - 1, out=scaled)
+    if not all_finite:
+        scaled[~finite] = -1
+    return scaled.astype(np.int32), edges
+
+
+def _pair_grid(x_bins: np.ndarray, y_bins: np.ndarray, bins: int) -> np.ndarray:
+    """2列のビン番号から2次元ヒストグラム（[xのビン, yのビン] の件数）を集計する"""
+    flat = x_bins * bins
+    flat += y_bins
+    if x_bins.min() < 0 or y_bins.min() < 0:
+        flat = flat[(x_bins >= 0) & (y_bins >= 0)]
+    return np.bincount(flat, minlength=bins * bins).reshape(bins, bins)
+
+
+def compute_pair_density(df: pd.DataFrame, columns: List[str], bins: int = DEFAULT_BINS, max_workers: int = 1,
+                         progress: Optional[Callable[[float, str], None]] = None) -> Dict[str, object]:
+    """全ての列の組について密度グリッドを、各列についてヒストグラムを計算する
+
+    max_workers が2以上の場合は列ごとのビン化と列の組ごとの集計をスレッドプールで並列に実行する。
+    progress には進捗（0.0〜1.0）とメッセージを受け取る関数を指定できる（呼び出し元のスレッドから呼ばれる）。
+    戻り値は columns / rows / edges（列 -> 境界） / histograms（列 -> 件数） /
+    grids（(列x, 列y) -> [xのビン, yのビン] の件数）を持つ辞書
+    """
+    def bin_column(col: str) -> Tuple[np.ndarray, np.ndarray]:
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        return _bin_indices(values, bins)
+
+    def count_pair(pair: Tuple[str, str]) -> np.ndarray:
+        return _pair_grid(binned[pair[0]], binned[pair[1]], bins)
+
+    def report(done: int, message: str) -> None:
+        if progress is not None:
+            progress(done / (len(columns) + len(pairs)), message)
+
+    pairs = list(combinations(columns, 2))
+    if max_workers > 1 and len(columns) > 2:
+        # numpyの演算はGILを解放するため、列のビン化と列の組ごとの集計をスレッドで並列に行う
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            report(0, "列をビンに変換中")
+            binned, edges = _unzip(columns, pool.map(bin_column, columns))
+            report(len(columns), "列の組ごとに集計中")
+            grids = dict(zip(pairs, pool.map(count_pair, pairs)))
+    else:
+        results = []
+        for i, col in enumerate(columns):
+            report(i, f"{col} をビンに変換中")
+            results.append(bin_column(col))
+        binned, edges = _unzip(columns, results)
+        grids = {}
+        for i, pair in enumerate(pairs):
+            report(len(columns) + i, f"{pair[0]} × {pair[1]}")
+            grids[pair] = count_pair(pair)
+
+    histograms = {
+        col: np.bincount(indices[indices >= 0], minlength=bins) for col, indices in binned.items()
+    }
+
+    return {
+        "columns": list(columns),
+        "rows": len(df),
+        "edges": edges,
+        "histograms": histograms,
+        "grids": grids,
+    }
+
+
+def _unzip(columns: List[str], results) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """列ごとの (ビン番号, ビンの境界) を2つの辞書に分ける"""
+    binned = {}
+    edges = {}
+    for col, (indices, col_edges) in zip(columns, results):
+        binned[col] = indices
+        edges[col] = col_edges
+    return binned, edges
+
+
+def pair_grid(density: Dict[str, object], x_col: str, y_col: str) -> np.ndarray:
+    """密度グリッドを [xのビン, yのビン] の向きで取り出す（逆順の組は転置して返す）"""
+    grids = density["grids"]
+    if (x_col, y_col) in grids:
+        return grids[(x_col, y_col)]
+    return grids[(y_col, x_col)].T
+
+
+def bin_centers(edges: np.ndarray) -> np.ndarray:
+    """ビンの境界から中心の値を計算する"""
+    return (edges[:-1] + edges[1:]) / 2
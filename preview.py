@@ -0,0 +1,47 @@
+"""
+データプレビューのページング処理
+フィルタリング結果の行番号をサーバー側で保持し、表示するページの行だけを切り出す
+"""
+
+import math
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def sort_order(values: pd.Series, ascending: bool = True) -> np.ndarray:
+    """列の並び順を行番号の配列として返す（欠損値は常に末尾）"""
+    ordered = values.reset_index(drop=True).sort_values(
+        ascending=ascending, kind="stable", na_position="last"
+    )
+    order = ordered.index.to_numpy(dtype=np.intp)
+    order.flags.writeable = False
+    return order
+
+
+def filter_positions(n_rows: int, mask: Optional[np.ndarray] = None, order: Optional[np.ndarray] = None) -> np.ndarray:
+    """フィルタ条件を満たす行番号を表示順に並べて返す
+
+    全行の並び順（order）をフィルタ結果（mask）で間引くため、条件を変えても並べ替えはやり直さない
+    """
+    if order is None:
+        positions = np.arange(n_rows, dtype=np.intp) if mask is None else np.flatnonzero(mask)
+    else:
+        positions = order if mask is None else order[mask[order]]
+    positions = np.asarray(positions, dtype=np.intp)
+    positions.flags.writeable = False
+    return positions
+
+
+def page_count(n_rows: int, page_size: int) -> int:
+    """総ページ数を返す（0行でも1ページとする）"""
+    return max(1, math.ceil(n_rows / page_size))
+
+
+def get_page(df: pd.DataFrame, positions: np.ndarray, page: int, page_size: int,
+             columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """指定ページ（1始まり）の行だけを取り出す（列の選択はページの行を切り出してから行う）"""
+    start = (page - 1) * page_size
+    page_df = df.iloc[positions[start:start + page_size]]
+    return page_df[columns] if columns is not None else page_df
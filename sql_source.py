@@ -0,0 +1,292 @@
+"""
+データベース（SQL）からのデータ取得処理
+DATABASE_URLの接続先にコネクションプール付きのSQLAlchemyエンジンで接続し、
+サーバーサイドカーソルでクエリ結果をチャンク単位に取得する。
+フィルタ式や集計はSQLに変換してデータベース側で実行することもできる
+"""
+
+import ast
+import hashlib
+import importlib.util
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from aggregation import ROW_COUNT_LABEL, flatten_label
+from config import SQL_CHUNK_SIZE
+from filter_engine import parse_filter
+from loaders import normalize_chunks, normalize_dtypes
+
+# クエリ結果を副問い合わせとして参照する際の別名
+SOURCE_ALIAS = "src"
+
+# SQLで計算できる集計関数の表示名（中央値・標準偏差はデータベースにより非対応のためpandasで計算する）
+SQL_AGG_FUNCTIONS = ["合計", "平均", "件数", "最小", "最大", "ユニーク数"]
+
+
+def sqlalchemy_available() -> bool:
+    """SQLAlchemyがインストールされているかどうか"""
+    return importlib.util.find_spec("sqlalchemy") is not None
+
+
+def create_pooled_engine(url: str, pool_size: int = 5):
+    """コネクションプール付きのエンジンを作成する（切断された接続は使用前の確認で張り直す）"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.engine import make_url
+
+    options = {"pool_pre_ping": True}
+    if make_url(url).get_backend_name() != "sqlite":
+        options["pool_size"] = pool_size
+    return create_engine(url, **options)
+
+
+def normalize_query(query: str) -> str:
+    """副問い合わせとして埋め込めるよう、前後の空白と末尾のセミコロンを取り除く"""
+    return query.strip().rstrip(";").strip()
+
+
+def query_fingerprint(url: str, query: str, fetch_filter: Optional[str] = None,
+                      dtype_backend: Optional[str] = None, refreshed_at: Optional[float] = None) -> str:
+    """接続先・クエリ・取得時の絞り込み条件からデータセットを識別するキーを生成する"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (url, normalize_query(query), fetch_filter or "", dtype_backend or "", repr(refreshed_at)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+def query_columns(engine, query: str) -> List[str]:
+    """クエリ結果の列名を取得する（行は取得しない）"""
+    from sqlalchemy import text
+
+    probe = text(f"SELECT * FROM ({normalize_query(query)}) AS {SOURCE_ALIAS} WHERE 1 = 0")
+    with engine.connect() as conn:
+        return [str(name) for name in conn.execute(probe).keys()]
+
+
+def _source(query: str, columns: List[str]):
+    """クエリを列名付きの副問い合わせにする"""
+    from sqlalchemy import column, text
+
+    return text(normalize_query(query)).columns(*[column(name) for name in columns]).subquery(SOURCE_ALIAS)
+
+
+def _python_value(value):
+    """NumPyのスカラーをバインド変数に渡せるPythonの値に変換する"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+
+def compile_filter(expression: str, source):
+    """フィルタ式をSQLの条件式に変換する
+
+    構文と列名の検証は parse_filter と共通。定数はバインド変数として渡すため、SQLインジェクションは起こらない
+    """
+    tree = parse_filter(expression, list(source.c.keys()))
+    return _compile_node(tree, source)
+
+
+def _compile_node(node: ast.AST, source):
+    """構文木を再帰的にSQLAlchemyの式に変換する"""
+    from sqlalchemy import and_, false, not_, or_
+    from sqlalchemy.sql.functions import coalesce
+
+    if isinstance(node, ast.BoolOp):
+        clauses = [_compile_node(value, source) for value in node.values]
+        return and_(*clauses) if isinstance(node.op, ast.And) else or_(*clauses)
+    if isinstance(node, ast.UnaryOp):
+        # pandas側と同じく、欠損値との比較結果（NULL）を偽として否定する
+        return not_(coalesce(_compile_node(node.operand, source), false()))
+    if isinstance(node, ast.Compare):
+        return _compile_compare(node, source)
+    return _compile_call(node, source)
+
+
+def _compile_operand(node: ast.AST, source):
+    """比較式の左辺・右辺をSQLの列または定数に変換する"""
+    if isinstance(node, ast.Name):
+        return source.c[node.id]
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return [element.value for element in node.elts]
+    return ast.literal_eval(node)
+
+
+_SQL_COMPARE_OPS: Dict[type, Callable] = {
+    ast.Eq: lambda left, right: left == right,
+    ast.NotEq: lambda left, right: left != right,
+    ast.Lt: lambda left, right: left < right,
+    ast.LtE: lambda left, right: left <= right,
+    ast.Gt: lambda left, right: left > right,
+    ast.GtE: lambda left, right: left >= right,
+}
+
+
+def _compile_compare(node: ast.Compare, source):
+    """比較式（連続比較 a < 列 < b を含む）を変換する"""
+    from sqlalchemy import and_
+
+    clauses = []
+    left_node = node.left
+    for op, right_node in zip(node.ops, node.comparators):
+        left = _compile_operand(left_node, source)
+        right = _compile_operand(right_node, source)
+        if isinstance(op, (ast.In, ast.NotIn)):
+            clause = left.in_(right) if isinstance(op, ast.In) else left.not_in(right)
+        else:
+            # 左辺が定数の場合はPythonの演算子の反転により「列 > 定数」の形に変換される
+            clause = _SQL_COMPARE_OPS[type(op)](left, right)
+        clauses.append(clause)
+        left_node = right_node
+    return and_(*clauses) if len(clauses) > 1 else clauses[0]
+
+
+def _compile_call(node: ast.Call, source):
+    """関数呼び出し（isnull, contains など）を変換する"""
+    from sqlalchemy import String, cast
+
+    name = node.func.id
+    col = source.c[node.args[0].id]
+    if name == "isnull":
+        return col.is_(None)
+    if name == "notnull":
+        return col.is_not(None)
+    text_col = cast(col, String)
+    if name == "contains":
+        return text_col.contains(node.args[1].value, autoescape=True)
+    return text_col.startswith(node.args[1].value, autoescape=True)
+
+
+def filter_key_clause(source, filter_key: Tuple):
+    """アプリの絞り込み条件 (数値範囲, カテゴリ値, フィルタ式) をSQLの条件式に変換する"""
+    from sqlalchemy import and_
+
+    numeric_filter, category_filter, filter_expression = filter_key
+    clauses = []
+    if numeric_filter is not None:
+        col, (lower, upper) = numeric_filter
+        clauses.append(source.c[col].between(_python_value(lower), _python_value(upper)))
+    if category_filter is not None:
+        col, values = category_filter
+        clauses.append(source.c[col].in_([_python_value(value) for value in values]))
+    if filter_expression:
+        clauses.append(compile_filter(filter_expression, source))
+    if not clauses:
+        return None
+    return and_(*clauses)
+
+
+def build_select(engine, query: str, fetch_filter: Optional[str] = None):
+    """クエリ結果に取得時の絞り込み条件を加えたSELECT文と副問い合わせを作成する"""
+    from sqlalchemy import select
+
+    source = _source(query, query_columns(engine, query))
+    statement = select(source)
+    if fetch_filter:
+        statement = statement.where(compile_filter(fetch_filter, source))
+    return statement, source
+
+
+def _iter_raw_chunks(engine, query: str, fetch_filter: Optional[str], chunksize: int,
+                     dtype_backend: Optional[str]) -> Iterator[pd.DataFrame]:
+    """クエリ結果をサーバーサイドカーソルでチャンク単位に取得する（データ型の後処理なし）"""
+    statement, _ = build_select(engine, query, fetch_filter)
+    options = {"dtype_backend": dtype_backend} if dtype_backend else {}
+    with engine.connect() as conn:
+        # stream_results を指定すると、対応するドライバーでは結果全体をクライアントに読み込まない
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+        yield from pd.read_sql_query(statement, conn, chunksize=chunksize, **options)
+
+
+def iter_query_chunks(engine, query: str, fetch_filter: Optional[str] = None, chunksize: int = SQL_CHUNK_SIZE,
+                      dtype_backend: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """クエリ結果をチャンク単位で取得する（全てのチャンクを先頭のチャンクと同じデータ型に揃える）"""
+    yield from normalize_chunks(_iter_raw_chunks(engine, query, fetch_filter, chunksize, dtype_backend))
+
+
+def read_query(engine, query: str, fetch_filter: Optional[str] = None, dtype_backend: Optional[str] = None,
+               chunksize: int = SQL_CHUNK_SIZE) -> pd.DataFrame:
+    """クエリ結果をチャンク単位で取得して1つのDataFrameにする"""
+    chunks = list(_iter_raw_chunks(engine, query, fetch_filter, chunksize, dtype_backend))
+    if not chunks:
+        return pd.DataFrame(columns=query_columns(engine, query))
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    # 日時列の判定は全チャンクを結合してから1回だけ行う
+    return normalize_dtypes(df)
+
+
+# ---- 集計のプッシュダウン ----
+
+def _sql_aggregates() -> Dict[str, Callable]:
+    """表示名 -> SQLAlchemyの集計式を作る関数"""
+    from sqlalchemy import func
+
+    return {
+        "合計": func.sum,
+        "平均": func.avg,
+        "件数": func.count,
+        "最小": func.min,
+        "最大": func.max,
+        "ユニーク数": lambda col: func.count(col.distinct()),
+    }
+
+
+def supports_sql_pivot(aggfuncs: List[str], time_grain: Optional[str]) -> bool:
+    """集計条件をSQLで実行できるかどうか（日時の集計単位はデータベースごとに関数が異なるため非対応）"""
+    return time_grain is None and all(name in SQL_AGG_FUNCTIONS for name in aggfuncs)
+
+
+def sql_pivot(engine, query: str, fetch_filter: Optional[str], filter_key: Tuple, rows: List[str],
+              columns: Optional[List[str]] = None, values: Optional[List[str]] = None,
+              aggfuncs: Optional[List[str]] = None) -> pd.DataFrame:
+    """ピボットテーブルをGROUP BYでデータベース側で集計する
+
+    結果の形式は aggregation.pivot_aggregate と同じ（グループ化キーが欠損した行は除外）
+    """
+    from sqlalchemy import and_, func, select
+
+    columns = columns or []
+    values = [col for col in (values or []) if col not in rows + columns]
+    keys = rows + columns
+    if not keys:
+        raise ValueError("行または列を1つ以上指定してください")
+
+    statement, _ = build_select(engine, query, fetch_filter)
+    base = statement.subquery("filtered")
+    group_cols = [base.c[key] for key in keys]
+
+    if values and aggfuncs:
+        aggregates = _sql_aggregates()
+        labels = [(value, name) for value in values for name in aggfuncs]
+        measures = [aggregates[name](base.c[value]).label(f"m{i}") for i, (value, name) in enumerate(labels)]
+    else:
+        labels = [ROW_COUNT_LABEL]
+        measures = [func.count().label("m0")]
+
+    conditions = [col.is_not(None) for col in group_cols]
+    app_clause = filter_key_clause(base, filter_key)
+    if app_clause is not None:
+        conditions.append(app_clause)
+
+    grouped = (
+        select(*group_cols, *measures)
+        .where(and_(*conditions))
+        .group_by(*group_cols)
+        .order_by(*group_cols)
+    )
+    with engine.connect() as conn:
+        result = pd.read_sql_query(grouped, conn)
+
+    result = result.set_index(keys)
+    if values and aggfuncs:
+        result.columns = pd.MultiIndex.from_tuples(labels)
+    else:
+        result.columns = labels
+    if columns:
+        result = result.unstack(columns)
+    result.columns = [flatten_label(label) for label in result.columns]
+    return result
+
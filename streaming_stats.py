@@ -0,0 +1,356 @@
+"""
+ストリーミング統計処理
+チャンク単位で更新でき、並列に計算した結果どうしを結合できる集計器（Welford/Chan法の平均・分散、
+共モーメント行列、最小値・最大値・欠損数）を提供する。全データをメモリに載せずに
+基本統計・Pearson相関・Z-scoreの閾値を1パスで正確に求められる
+"""
+
+import copy
+from functools import reduce
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _as_matrix(chunk: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """指定列を数値に変換した2次元配列（行 × 列、欠損値はNaN）を作成する"""
+    if len(chunk) == 0 or not columns:
+        return np.empty((len(chunk), len(columns)))
+    return np.column_stack([
+        pd.to_numeric(chunk[col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        for col in columns
+    ])
+
+
+class MomentAccumulator:
+    """列ごとの件数・平均・偏差平方和・最小値・最大値・欠損数を逐次集計する"""
+
+    def __init__(self, columns: List[str]):
+        k = len(columns)
+        self.columns = list(columns)
+        self.count = np.zeros(k, dtype=np.int64)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+        self.nulls = np.zeros(k, dtype=np.int64)
+
+    def update(self, chunk: pd.DataFrame) -> "MomentAccumulator":
+        """チャンクを集計に加える"""
+        values = _as_matrix(chunk, self.columns)
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(count > 0, np.where(valid, values, 0.0).sum(axis=0) / count, 0.0)
+        part = MomentAccumulator(self.columns)
+        part.count = count
+        part.mean = mean
+        part.m2 = np.where(valid, (values - mean) ** 2, 0.0).sum(axis=0)
+        part.min = np.where(valid, values, np.inf).min(axis=0, initial=np.inf)
+        part.max = np.where(valid, values, -np.inf).max(axis=0, initial=-np.inf)
+        part.nulls = len(values) - count
+        return self.merge(part)
+
+    def merge(self, other: "MomentAccumulator") -> "MomentAccumulator":
+        """別の集計器の結果を結合する（Chanらの並列アルゴリズム）"""
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(n > 0, other.count / n, 0.0)
+            self.mean = self.mean + delta * weight
+            self.m2 = self.m2 + other.m2 + np.where(n > 0, delta ** 2 * self.count * weight, 0.0)
+        self.count = n
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.nulls = self.nulls + other.nulls
+        return self
+
+    def variance(self, ddof: int = 1) -> np.ndarray:
+        """分散（ddof=1で不偏分散）"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def std(self, ddof: int = 1) -> np.ndarray:
+        """標準偏差（ddof=1で不偏標準偏差）"""
+        return np.sqrt(self.variance(ddof))
+
+
+class CoMomentAccumulator:
+    """列の組ごとの共モーメント行列を逐次集計する
+
+    pandasのcorrと同じく、両方の列が欠損していない行のみを各組の計算に使う。
+    mean[i, j] / m2[i, j] は列jも欠損していない行における列iの平均・偏差平方和
+    """
+
+    def __init__(self, columns: List[str]):
+        k = len(columns)
+        self.columns = list(columns)
+        self.count = np.zeros((k, k), dtype=np.int64)
+        self.mean = np.zeros((k, k))
+        self.m2 = np.zeros((k, k))
+        self.comoment = np.zeros((k, k))
+
+    def update(self, chunk: pd.DataFrame) -> "CoMomentAccumulator":
+        """チャンクを集計に加える"""
+        values = _as_matrix(chunk, self.columns)
+        valid = ~np.isnan(values)
+        # 桁落ちを防ぐため、チャンク内の列平均を引いてから積和を行列積で集計する
+        counts = valid.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shift = np.where(counts > 0, np.where(valid, values, 0.0).sum(axis=0) / counts, 0.0)
+        centered = np.where(valid, values - shift, 0.0)
+        weights = valid.astype(float)
+
+        n = weights.T @ weights
+        sx = centered.T @ weights
+        sxx = (centered * centered).T @ weights
+        sxy = centered.T @ centered
+        with np.errstate(divide="ignore", invalid="ignore"):
+            part = CoMomentAccumulator(self.columns)
+            part.count = n.round().astype(np.int64)
+            part.mean = np.where(n > 0, shift[:, None] + sx / n, 0.0)
+            part.m2 = np.where(n > 0, sxx - sx ** 2 / n, 0.0)
+            part.comoment = np.where(n > 0, sxy - sx * sx.T / n, 0.0)
+        return self.merge(part)
+
+    def merge(self, other: "CoMomentAccumulator") -> "CoMomentAccumulator":
+        """別の集計器の結果を結合する（Chanらの並列アルゴリズム）"""
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(n > 0, other.count / n, 0.0)
+            scale = np.where(n > 0, self.count * weight, 0.0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + other.m2 + delta ** 2 * scale
+        # 列jの平均の差は delta[j, i] で与えられる
+        self.comoment = self.comoment + other.comoment + delta * delta.T * scale
+        self.count = n
+        return self
+
+    def covariance(self, ddof: int = 1) -> pd.DataFrame:
+        """共分散行列"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = np.where(self.count > ddof, self.comoment / (self.count - ddof), np.nan)
+        return pd.DataFrame(cov, index=self.columns, columns=self.columns)
+
+    def correlation(self) -> pd.DataFrame:
+        """Pearson相関行列"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = self.comoment / np.sqrt(self.m2 * self.m2.T)
+        corr = np.where(self.count > 1, np.clip(corr, -1.0, 1.0), np.nan)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+
+class StreamingStats:
+    """行数・列ごとのモーメント・共モーメント行列をまとめて逐次集計する"""
+
+    def __init__(self, columns: List[str]):
+        self.columns = list(columns)
+        self.rows = 0
+        self.moments = MomentAccumulator(columns)
+        self.comoments = CoMomentAccumulator(columns)
+
+    def update(self, chunk: pd.DataFrame) -> "StreamingStats":
+        """チャンクを集計に加える"""
+        self.rows += len(chunk)
+        self.moments.update(chunk)
+        self.comoments.update(chunk)
+        return self
+
+    def merge(self, other: "StreamingStats") -> "StreamingStats":
+        """別の集計結果（他のワーカーで計算したものなど）を結合する"""
+        self.rows += other.rows
+        self.moments.merge(other.moments)
+        self.comoments.merge(other.comoments)
+        return self
+
+    def describe(self) -> pd.DataFrame:
+        """DataFrame.describe と同じ向きの基本統計表（四分位数を除く）を作成する"""
+        moments = self.moments
+        has_values = moments.count > 0
+        return pd.DataFrame(
+            [
+                moments.count,
+                np.where(has_values, moments.mean, np.nan),
+                moments.std(),
+                np.where(has_values, moments.min, np.nan),
+                np.where(has_values, moments.max, np.nan),
+                moments.nulls,
+            ],
+            index=["count", "mean", "std", "min", "max", "欠損数"],
+            columns=self.columns,
+        )
+
+    def zscore_bounds(self, column: str, threshold: float) -> Tuple[float, float]:
+        """Z-scoreの絶対値が閾値を超える境界値（scipy.stats.zscoreと同じく母標準偏差を使用）"""
+        i = self.columns.index(column)
+        mean = self.moments.mean[i]
+        std = self.moments.std(ddof=0)[i]
+        return mean - threshold * std, mean + threshold * std
+
+
+def hash_rows(chunk: pd.DataFrame, columns: Optional[List[str]] = None) -> np.ndarray:
+    """行（または指定列の組）ごとの64ビットのハッシュ値を計算する"""
+    frame = chunk if columns is None else chunk[columns]
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+class DuplicateTracker:
+    """出現済みの行のハッシュ値を記録し、チャンクをまたいで重複行を判定する
+
+    記録はソート済み配列の列として保持し、二分探索で照合する。サイズの近い配列どうしを順に
+    マージするため、追加分の照合と登録は記録全体の大きさにほぼよらない時間で行える。
+    1チャンクだけの場合はチャンク内の重複判定だけで済ませ、次のチャンクが来た時点で登録する
+    """
+
+    def __init__(self):
+        self._runs: List[np.ndarray] = []
+        self._pending: List[np.ndarray] = []
+
+    def update(self, hashes: np.ndarray) -> np.ndarray:
+        """ハッシュ値を記録し、既出（チャンク内で2回目以降を含む）の行をTrueとするマスクを返す"""
+        duplicated = pd.Series(hashes).duplicated().to_numpy()
+        if self._pending or self._runs:
+            self.flush()
+            # copy-on-write 有効時は to_numpy() の結果が読み取り専用のため、新しい配列を作る
+            duplicated = duplicated | self._contains(hashes)
+        self._pending.append(hashes[~duplicated])
+        return duplicated
+
+    def copy(self) -> "DuplicateTracker":
+        """記録の複製（登録済みの配列は更新時に置き換えるため共有する）"""
+        other = DuplicateTracker()
+        other._runs = list(self._runs)
+        other._pending = list(self._pending)
+        return other
+
+    def merge(self, other: "DuplicateTracker") -> "DuplicateTracker":
+        """別の記録を結合する"""
+        self.flush()
+        other.flush()
+        for run in other._runs:
+            self._add_run(run[~self._contains(run)])
+        return self
+
+    def flush(self) -> None:
+        """保留中のハッシュ値を照合用の配列に登録する"""
+        for hashes in self._pending:
+            self._add_run(hashes)
+        self._pending.clear()
+
+    def _add_run(self, hashes: np.ndarray) -> None:
+        """ソート済み配列として登録し、直前の配列が同程度の大きさ以下ならマージする"""
+        run = np.sort(hashes)
+        while self._runs and len(self._runs[-1]) <= 2 * len(run):
+            # ソート済みの2つの配列の連結は安定ソート（Timsort）で線形時間でマージされる
+            run = np.sort(np.concatenate([self._runs.pop(), run]), kind="stable")
+        self._runs.append(run)
+
+    def _contains(self, hashes: np.ndarray) -> np.ndarray:
+        """登録済みのハッシュ値をTrueとするマスク"""
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self._runs:
+            if len(run) == 0:
+                continue
+            positions = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[positions] == hashes
+        return found
+
+    @property
+    def nbytes(self) -> int:
+        """記録しているハッシュ値のバイト数"""
+        return sum(run.nbytes for run in self._runs) + sum(hashes.nbytes for hashes in self._pending)
+
+    def __len__(self) -> int:
+        """記録している異なる行の数"""
+        return sum(len(run) for run in self._runs) + sum(len(hashes) for hashes in self._pending)
+
+
+class DatasetProfile:
+    """データセット全体の基本統計・カテゴリ値の件数・欠損数・重複行を逐次集計する
+
+    末尾に行が追記された場合は、追記された行だけで更新できる
+    """
+
+    def __init__(self, numeric_columns: List[str], category_columns: List[str]):
+        self.rows = 0
+        self.dtypes: Optional[pd.Series] = None
+        self.stats = StreamingStats(numeric_columns)
+        self.category_counts: Dict[str, pd.Series] = {col: pd.Series(dtype="int64") for col in category_columns}
+        self.nulls = pd.Series(dtype="int64")
+        self.duplicates = DuplicateTracker()
+        self._duplicate_positions: List[np.ndarray] = []
+
+    def update(self, chunk: pd.DataFrame) -> "DatasetProfile":
+        """チャンク（追記された行）を集計に加える"""
+        if self.dtypes is None:
+            self.dtypes = chunk.dtypes
+        self.stats.update(chunk)
+        for col, counts in self.category_counts.items():
+            self.category_counts[col] = counts.add(chunk[col].value_counts(), fill_value=0).astype("int64")
+        self.nulls = self.nulls.add(chunk.isna().sum(), fill_value=0).astype("int64")
+        duplicated = self.duplicates.update(hash_rows(chunk))
+        self._duplicate_positions.append(np.flatnonzero(duplicated) + self.rows)
+        self.rows += len(chunk)
+        # 次の追記で照合できるよう、記録を登録しておく
+        self.duplicates.flush()
+        return self
+
+    def copy(self) -> "DatasetProfile":
+        """集計結果の複製（各集計器は更新時に配列を置き換えるため、配列は共有する）"""
+        other = copy.copy(self)
+        other.stats = copy.copy(self.stats)
+        other.stats.moments = copy.copy(self.stats.moments)
+        other.stats.comoments = copy.copy(self.stats.comoments)
+        other.category_counts = dict(self.category_counts)
+        other.duplicates = self.duplicates.copy()
+        other._duplicate_positions = list(self._duplicate_positions)
+        return other
+
+    def value_counts(self, column: str) -> pd.Series:
+        """Series.value_counts と同じく件数の多い順の値ごとの件数"""
+        counts = self.category_counts[column]
+        return counts[counts > 0].sort_values(ascending=False, kind="stable").rename("count")
+
+    @property
+    def duplicate_count(self) -> int:
+        """2回目以降に出現した行の数"""
+        return sum(len(positions) for positions in self._duplicate_positions)
+
+    def duplicated(self) -> np.ndarray:
+        """DataFrame.duplicated と同じく2回目以降に出現した行をTrueとするマスク"""
+        mask = np.zeros(self.rows, dtype=bool)
+        if self._duplicate_positions:
+            mask[np.concatenate(self._duplicate_positions)] = True
+        return mask
+
+    def duplicate_examples(self, df: pd.DataFrame, limit: int = 10) -> pd.DataFrame:
+        """集計したデータセットから重複行の例（先頭の重複行と、それと同じ内容の行）を取り出す
+
+        最初の出現行は重複行より前にあるため、先頭から limit 件目の重複行までだけを照合する
+        """
+        positions = np.concatenate(self._duplicate_positions)[:limit] if self._duplicate_positions else []
+        if len(positions) == 0:
+            return df.iloc[:0]
+        head = df.iloc[:positions[-1] + 1]
+        hashes = hash_rows(head)
+        return head[np.isin(hashes, hashes[positions])].head(limit)
+
+    @property
+    def nbytes(self) -> int:
+        """重複判定の記録など、行数に比例して保持する配列のバイト数"""
+        return self.duplicates.nbytes + sum(positions.nbytes for positions in self._duplicate_positions)
+
+
+def accumulate_chunks(chunks: Iterable[pd.DataFrame], columns: List[str]) -> StreamingStats:
+    """チャンクを順に読み込みながら集計する"""
+    stats = StreamingStats(columns)
+    for chunk in chunks:
+        stats.update(chunk)
+    return stats
+
+
+def merge_stats(parts: Iterable[StreamingStats]) -> StreamingStats:
+    """複数の集計結果を1つに結合する"""
+    return reduce(lambda left, right: left.merge(right), parts)
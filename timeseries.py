@@ -0,0 +1,74 @@
+"""
+時系列分析処理
+日時列でソートしたインデックスを作成し、二分探索による期間の絞り込みと
+日・週・月単位のリサンプリング、移動平均などの計算を行う
+"""
+
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from aggregation import AGG_FUNCTIONS
+
+# 表示名 -> リサンプリングの頻度
+RESAMPLE_FREQUENCIES: Dict[str, str] = {
+    "時間": "h",
+    "日": "D",
+    "週": "W",
+    "月": "MS",
+    "四半期": "QS",
+    "年": "YS",
+}
+
+# 移動窓で計算できる関数
+ROLLING_FUNCTIONS: Dict[str, str] = {
+    "平均": "mean",
+    "合計": "sum",
+    "中央値": "median",
+    "最小": "min",
+    "最大": "max",
+}
+
+
+def build_time_index(df: pd.DataFrame, date_col: str, value_cols: List[str]) -> pd.DataFrame:
+    """日時列をソート済みのインデックスにしたDataFrameを作成する（日時が欠損した行は除外）"""
+    frame = df[[date_col] + [col for col in value_cols if col != date_col]]
+    frame = frame[frame[date_col].notna()]
+    return frame.set_index(date_col).sort_index(kind="stable")
+
+
+def slice_time_range(indexed: pd.DataFrame, start=None, end=None) -> pd.DataFrame:
+    """ソート済みの日時インデックスを二分探索して期間内の行を取り出す（終了日時を含む）"""
+    index = indexed.index
+    lower = 0 if start is None else index.searchsorted(_as_index_timestamp(index, start), side="left")
+    upper = len(index) if end is None else index.searchsorted(_as_index_timestamp(index, end), side="right")
+    return indexed.iloc[lower:upper]
+
+
+def _as_index_timestamp(index: pd.DatetimeIndex, value) -> pd.Timestamp:
+    """比較する日時をインデックスのタイムゾーンに合わせる"""
+    timestamp = pd.Timestamp(value)
+    if index.tz is not None and timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(index.tz)
+    return timestamp
+
+
+def resample_frame(indexed: pd.DataFrame, value_cols: List[str], frequency: str, aggfuncs: List[str]) -> pd.DataFrame:
+    """指定の頻度でリサンプリングし、集計関数を適用する
+
+    frequency は RESAMPLE_FREQUENCIES、aggfuncs は AGG_FUNCTIONS の表示名で指定する
+    """
+    resampled = indexed[value_cols].resample(RESAMPLE_FREQUENCIES[frequency])
+    result = resampled.agg([AGG_FUNCTIONS[name] for name in aggfuncs])
+    labels = {func: name for name, func in AGG_FUNCTIONS.items()}
+    result.columns = [f"{value} / {labels[func]}" for value, func in result.columns]
+    return result
+
+
+def add_rolling(resampled: pd.DataFrame, window: int, function: str = "平均",
+                columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """リサンプリング結果に移動窓の集計列を追加する"""
+    columns = columns or resampled.columns.tolist()
+    rolling = resampled[columns].rolling(window, min_periods=1).agg(ROLLING_FUNCTIONS[function])
+    rolling.columns = [f"{col}（{window}期間移動{function}）" for col in columns]
+    return resampled.join(rolling)
@@ -0,0 +1,207 @@
+"""
+回帰線（トレンドライン）の計算処理
+statsmodelsを使わず、グループごとの十分統計量（件数・総和・積和）を1回のgroupbyで集計して
+線形回帰・多項式回帰を閉形式で求める。LOWESSはビンごとの平均に対して計算する
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 表示名 -> 回帰モデル
+TRENDLINE_MODELS: Dict[str, str] = {
+    "線形回帰": "linear",
+    "多項式回帰": "polynomial",
+    "LOWESS（ビン集計）": "lowess",
+}
+
+# 多項式回帰・LOWESSの回帰線を描画する点の数
+LINE_POINTS = 100
+
+# グループ化しない場合のグループ名
+ALL_GROUP = "全体"
+
+
+def _prepare(df: pd.DataFrame, x: str, y: str, group: Optional[str]) -> pd.DataFrame:
+    """回帰に使う列を取り出し、欠損値を含む行を除外する"""
+    columns = [x, y] + ([group] if group else [])
+    frame = df[columns].dropna()
+    frame = pd.DataFrame({
+        "x": frame[x].astype(float),
+        "y": frame[y].astype(float),
+        "group": frame[group] if group else ALL_GROUP,
+    })
+    return frame
+
+
+def fit_linear(df: pd.DataFrame, x: str, y: str, group: Optional[str] = None) -> pd.DataFrame:
+    """グループごとの単回帰（最小二乗法）の係数と決定係数を計算する
+
+    戻り値はグループをインデックスとし、件数・傾き・切片・R²・xの範囲を列に持つDataFrame
+    """
+    frame = _prepare(df, x, y, group)
+    # 桁落ちを防ぐため全体の平均で中心化してから積和を集計する
+    x_shift = frame["x"].mean()
+    y_shift = frame["y"].mean()
+    dx = frame["x"] - x_shift
+    dy = frame["y"] - y_shift
+    sums = pd.DataFrame({
+        "group": frame["group"], "x": dx, "y": dy,
+        "xx": dx * dx, "xy": dx * dy, "yy": dy * dy,
+        "x_min": frame["x"], "x_max": frame["x"],
+    }).groupby("group", observed=True, sort=True).agg(
+        n=("x", "size"), sx=("x", "sum"), sy=("y", "sum"),
+        sxx=("xx", "sum"), sxy=("xy", "sum"), syy=("yy", "sum"),
+        x_min=("x_min", "min"), x_max=("x_max", "max"),
+    )
+
+    n = sums["n"]
+    cov = n * sums["sxy"] - sums["sx"] * sums["sy"]
+    var_x = n * sums["sxx"] - sums["sx"] ** 2
+    var_y = n * sums["syy"] - sums["sy"] ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = cov / var_x
+        intercept = (sums["sy"] - slope * sums["sx"]) / n
+        r2 = cov ** 2 / (var_x * var_y)
+
+    return pd.DataFrame({
+        "件数": n,
+        "傾き": slope,
+        "切片": intercept + y_shift - slope * x_shift,
+        "R²": r2,
+        "x_min": sums["x_min"],
+        "x_max": sums["x_max"],
+    })
+
+
+def fit_polynomial(df: pd.DataFrame, x: str, y: str, degree: int = 2,
+                   group: Optional[str] = None) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """グループごとの多項式回帰の係数と決定係数を計算する
+
+    Σx^k（k ≤ 2×次数）と Σx^k·y を1回のgroupbyで集計し、正規方程式を解く。
+    係数は「係数_k」列（x^k の係数、元のxの尺度）として返す。点の数が 次数+1 に満たないグループは除外する。
+    戻り値は (係数の表, グループ名 -> 回帰線の座標)
+    """
+    frame = _prepare(df, x, y, group)
+    # 条件数を抑えるため全体の平均・標準偏差で標準化する（1行だけ・全て同じ値の場合は標準化しない）
+    center = frame["x"].mean()
+    scale = frame["x"].std()
+    if not np.isfinite(scale) or scale == 0:
+        scale = 1.0
+    t = (frame["x"] - center) / scale
+
+    powers = {f"p{k}": t ** k for k in range(2 * degree + 1)}
+    moments = {f"q{k}": (t ** k) * frame["y"] for k in range(degree + 1)}
+    sums = pd.DataFrame({
+        "group": frame["group"], **powers, **moments, "yy": frame["y"] ** 2,
+        "x_min": frame["x"], "x_max": frame["x"],
+    }).groupby("group", observed=True, sort=True).agg(
+        {**{col: "sum" for col in list(powers) + list(moments) + ["yy"]}, "x_min": "min", "x_max": "max"}
+    )
+
+    rows = []
+    names = []
+    lines = {}
+    for name, row in sums.iterrows():
+        n = row["p0"]
+        if n < degree + 1:
+            # 係数の数より点が少ないグループは多項式が定まらないため除外する
+            continue
+        gram = np.array([[row[f"p{i + j}"] for j in range(degree + 1)] for i in range(degree + 1)])
+        rhs = np.array([row[f"q{k}"] for k in range(degree + 1)])
+        beta = np.linalg.lstsq(gram, rhs, rcond=None)[0]
+        sse = row["yy"] - 2 * beta @ rhs + beta @ gram @ beta
+        sst = row["yy"] - row["q0"] ** 2 / n
+        coefficients = _unscale_polynomial(beta, center, scale)
+        # 回帰線は桁落ちしないよう標準化したxの上で評価する
+        xs = np.linspace(row["x_min"], row["x_max"], LINE_POINTS)
+        lines[name] = pd.DataFrame({"x": xs, "y": np.polynomial.Polynomial(beta)((xs - center) / scale)})
+        names.append(name)
+        rows.append({
+            "件数": int(n),
+            **{f"係数_{k}": coefficients[k] for k in range(degree + 1)},
+            "R²": 1 - sse / sst if sst > 0 else np.nan,
+            "x_min": row["x_min"],
+            "x_max": row["x_max"],
+        })
+    return pd.DataFrame(rows, index=pd.Index(names, name=sums.index.name)), lines
+
+
+def _unscale_polynomial(beta: np.ndarray, center: float, scale: float) -> np.ndarray:
+    """標準化したxに対する係数を元のxに対する係数に変換する"""
+    # p(t) = Σ beta_k t^k, t = (x - center) / scale を x の多項式として展開する
+    poly = np.polynomial.Polynomial(beta)
+    linear = np.polynomial.Polynomial([-center / scale, 1 / scale])
+    coefficients = poly(linear).coef
+    return np.pad(coefficients, (0, len(beta) - len(coefficients)))
+
+
+def fit_lowess(df: pd.DataFrame, x: str, y: str, group: Optional[str] = None,
+               bins: int = 200, frac: float = 0.3) -> Dict[str, pd.DataFrame]:
+    """xをビンに分けた平均値に対してLOWESS（局所線形回帰）を計算する
+
+    全行ではなくビン（最大 bins 個）の平均を件数で重み付けして回帰するため、
+    計算量はデータ件数にほぼ依存しない。戻り値はグループ名 -> 回帰線の座標
+    """
+    frame = _prepare(df, x, y, group)
+    edges = np.linspace(frame["x"].min(), frame["x"].max(), bins + 1)
+    frame["bin"] = np.clip(np.searchsorted(edges, frame["x"], side="right") - 1, 0, bins - 1)
+    binned = frame.groupby(["group", "bin"], observed=True, sort=True).agg(
+        x=("x", "mean"), y=("y", "mean"), n=("y", "size")
+    )
+
+    lines = {}
+    for name, points in binned.groupby(level="group", observed=True, sort=True):
+        lines[name] = pd.DataFrame({
+            "x": points["x"].to_numpy(),
+            "y": _local_linear(points["x"].to_numpy(), points["y"].to_numpy(), points["n"].to_numpy(), frac),
+        })
+    return lines
+
+
+def _local_linear(xs: np.ndarray, ys: np.ndarray, weights: np.ndarray, frac: float) -> np.ndarray:
+    """トライキューブ重みによる局所線形回帰の推定値を計算する"""
+    n = len(xs)
+    if n < 3:
+        return ys.astype(float)
+    k = max(2, int(np.ceil(frac * n)))
+    distances = np.abs(xs[:, None] - xs[None, :])
+    # 各点からk番目に近い点までの距離を窓幅とする
+    bandwidth = np.partition(distances, k - 1, axis=1)[:, k - 1]
+    bandwidth[bandwidth == 0] = np.finfo(float).eps
+    w = np.clip(1 - (distances / bandwidth[:, None]) ** 3, 0, None) ** 3 * weights[None, :]
+
+    sw = w.sum(axis=1)
+    swx = w @ xs
+    swy = w @ ys
+    swxx = w @ (xs * xs)
+    swxy = w @ (xs * ys)
+    denominator = sw * swxx - swx ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(denominator > 0, (sw * swxy - swx * swy) / denominator, 0.0)
+    intercept = (swy - slope * swx) / sw
+    return intercept + slope * xs
+
+
+def fit_trendline(df: pd.DataFrame, x: str, y: str, model: str, group: Optional[str] = None,
+                  degree: int = 2) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """回帰モデルを当てはめ、(グループごとの係数・R²の表, グループ名 -> 回帰線の座標) を返す
+
+    model は TRENDLINE_MODELS の値（linear / polynomial / lowess）で指定する
+    """
+    if model == "linear":
+        fit = fit_linear(df, x, y, group)
+        lines = {
+            name: pd.DataFrame({
+                "x": [row["x_min"], row["x_max"]],
+                "y": [row["切片"] + row["傾き"] * row["x_min"], row["切片"] + row["傾き"] * row["x_max"]],
+            })
+            for name, row in fit.iterrows()
+        }
+    elif model == "polynomial":
+        fit, lines = fit_polynomial(df, x, y, degree, group)
+    else:
+        lines = fit_lowess(df, x, y, group)
+        fit = pd.DataFrame({"ビン数": {name: len(line) for name, line in lines.items()}})
+    return fit.drop(columns=["x_min", "x_max"], errors="ignore"), lines
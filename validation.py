@@ -0,0 +1,506 @@
+"""
+データ検証エンジン
+型・値の範囲・許可された値・正規表現の形式・一意性・列間の条件などのルールを
+ベクトル演算の行マスクとして評価し、ルールごとの違反件数・違反例・違反行を集計する。
+ルールはJSONで宣言するか、データから推定したものを使う。チャンク単位で更新できるため、
+メモリに載らない大きさのファイルもストリーム処理で検証できる
+"""
+
+import json
+import re
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from filter_engine import FilterExpressionError, evaluate_filter, parse_filter, referenced_columns
+from streaming_stats import DuplicateTracker, hash_rows
+
+# ルールの種類 -> 表示名
+RULE_KINDS = {
+    "type": "データ型",
+    "not_null": "必須",
+    "range": "値の範囲",
+    "allowed": "許可された値",
+    "pattern": "形式",
+    "unique": "一意性",
+    "expression": "列間の条件",
+}
+
+# ルールの種類 -> 品質指標の分類
+RULE_CATEGORIES = {
+    "type": "データ型の一貫性",
+    "not_null": "必須項目",
+    "range": "値の範囲",
+    "allowed": "値の範囲",
+    "pattern": "値の範囲",
+    "unique": "一意性",
+    "expression": "列間の整合性",
+}
+
+# typeルールで指定できるデータ型
+TYPE_NAMES = ["数値", "整数", "日時", "文字列"]
+
+# ルールごとに保持する違反例の件数
+SAMPLE_SIZE = 5
+
+# エクスポート用に保持する違反行の上限（件数の集計は全行を対象に行う）
+MAX_BAD_ROWS = 100_000
+
+# ルールの推定: 許可された値として扱うユニーク数の上限、型を推定する際に変換できるべき値の割合、
+# 型・形式の判定に使う値の種類数（出現頻度の高い順）
+INFER_MAX_ALLOWED_VALUES = 20
+INFER_TYPE_RATIO = 0.95
+INFER_SAMPLE_VALUES = 10_000
+
+ROW_NUMBER_LABEL = "行番号"
+VIOLATION_LABEL = "違反ルール"
+
+
+class ValidationRuleError(ValueError):
+    """検証ルールの記述が不正な場合の例外"""
+
+
+# ---- ルールの読み込み・検証 ----
+
+def parse_rules(text: str, columns: List[str]) -> List[Dict]:
+    """JSON形式のルール定義を読み込み、列名と設定値を検証する"""
+    try:
+        rules = json.loads(text) if text.strip() else []
+    except json.JSONDecodeError as e:
+        raise ValidationRuleError(f"ルールのJSONが正しくありません: {e.msg}（{e.lineno}行目）") from e
+    if isinstance(rules, dict):
+        rules = rules.get("rules", [])
+    if not isinstance(rules, list):
+        raise ValidationRuleError("ルールはJSONの配列で指定してください")
+    for i, rule in enumerate(rules, start=1):
+        try:
+            check_rule(rule, columns)
+        except ValidationRuleError as e:
+            raise ValidationRuleError(f"{i}番目のルール: {e}") from e
+    return rules
+
+
+def rules_to_json(rules: List[Dict]) -> str:
+    """ルールをJSON文字列に変換する"""
+    return json.dumps(rules, ensure_ascii=False, indent=2, default=str)
+
+
+def _require_column(rule: Dict, columns: List[str]) -> None:
+    """ルールの対象列が存在することを確認する"""
+    column = rule.get("column")
+    if column not in columns:
+        raise ValidationRuleError(f"列 '{column}' は存在しません")
+
+
+def check_rule(rule: Dict, columns: List[str]) -> None:
+    """ルールの種類ごとに必要な設定値がそろっているか検証する"""
+    if not isinstance(rule, dict):
+        raise ValidationRuleError("ルールはオブジェクトで指定してください")
+    kind = rule.get("rule")
+    if kind not in RULE_KINDS:
+        raise ValidationRuleError(f"ルールの種類 '{kind}' は使用できません（{', '.join(RULE_KINDS)}）")
+
+    if kind == "unique":
+        keys = rule.get("columns") or ([rule["column"]] if "column" in rule else [])
+        missing = [col for col in keys if col not in columns]
+        if not keys or missing:
+            raise ValidationRuleError(f"一意性を確認する列が正しくありません: {missing or keys}")
+    elif kind == "expression":
+        try:
+            parse_filter(str(rule.get("expression", "")), columns)
+        except FilterExpressionError as e:
+            raise ValidationRuleError(str(e)) from e
+    else:
+        _require_column(rule, columns)
+
+    if kind == "type" and rule.get("type") not in TYPE_NAMES:
+        raise ValidationRuleError(f"データ型は {', '.join(TYPE_NAMES)} のいずれかを指定してください")
+    if kind == "range" and rule.get("min") is None and rule.get("max") is None:
+        raise ValidationRuleError("min または max を指定してください")
+    if kind == "allowed" and not isinstance(rule.get("values"), list):
+        raise ValidationRuleError("values に許可する値の配列を指定してください")
+    if kind == "pattern":
+        try:
+            re.compile(str(rule.get("pattern", "")))
+        except re.error as e:
+            raise ValidationRuleError(f"正規表現が正しくありません: {e}") from e
+
+
+def rule_name(rule: Dict) -> str:
+    """ルールの表示名（name が指定されていればそれを使う）"""
+    if rule.get("name"):
+        return str(rule["name"])
+    kind = rule["rule"]
+    if kind == "type":
+        return f"{rule['column']}: {rule['type']}"
+    if kind == "not_null":
+        return f"{rule['column']}: 必須"
+    if kind == "range":
+        lower = "" if rule.get("min") is None else rule["min"]
+        upper = "" if rule.get("max") is None else rule["max"]
+        return f"{rule['column']}: {lower}〜{upper}"
+    if kind == "allowed":
+        return f"{rule['column']}: 許可された値（{len(rule['values'])}種類）"
+    if kind == "pattern":
+        return f"{rule['column']}: /{rule['pattern']}/"
+    if kind == "unique":
+        return f"{', '.join(rule.get('columns') or [rule['column']])}: 一意"
+    return rule["expression"]
+
+
+# ---- 違反マスクの計算 ----
+
+def _map_unique(series: pd.Series, func: Callable[[pd.Series], np.ndarray]) -> np.ndarray:
+    """ユニーク値ごとに判定してから行に展開する（欠損値は違反としない）
+
+    文字列の変換や正規表現の照合は値の種類数だけ行えばよいため、行数が多く種類の少ない列で高速になる
+    """
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0:
+        return np.zeros(len(series), dtype=bool)
+    result = np.asarray(func(pd.Series(uniques, dtype=object)), dtype=bool)
+    return np.where(codes >= 0, result[codes], False)
+
+
+def _is_text(series: pd.Series) -> bool:
+    """文字列（object・string・category）の列かどうか"""
+    return (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+            or isinstance(series.dtype, pd.CategoricalDtype))
+
+
+def _type_violations(series: pd.Series, type_name: str) -> np.ndarray:
+    """指定したデータ型として解釈できない値をTrueとするマスク"""
+    notna = series.notna().to_numpy()
+    if type_name == "文字列":
+        if _is_text(series):
+            return _map_unique(series, lambda values: ~values.map(lambda value: isinstance(value, str)))
+        return notna
+    if type_name == "日時":
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return np.zeros(len(series), dtype=bool)
+        if _is_text(series):
+            return _map_unique(series, lambda values: pd.to_datetime(values, errors="coerce", format="mixed").isna())
+        return notna
+
+    if pd.api.types.is_bool_dtype(series) or not (pd.api.types.is_numeric_dtype(series) or _is_text(series)):
+        return notna
+    if type_name == "数値":
+        if pd.api.types.is_numeric_dtype(series):
+            return np.zeros(len(series), dtype=bool)
+        return _map_unique(series, lambda values: pd.to_numeric(values, errors="coerce").isna())
+    if pd.api.types.is_integer_dtype(series):
+        return np.zeros(len(series), dtype=bool)
+
+    def not_integer(values):
+        numbers = pd.to_numeric(values, errors="coerce").astype(float)
+        return ~(np.isfinite(numbers) & (numbers == np.floor(numbers)))
+
+    if _is_text(series):
+        return _map_unique(series, not_integer)
+    return notna & not_integer(series).to_numpy()
+
+
+def _bound(series: pd.Series, value):
+    """範囲の境界値を列の型に合わせる"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return pd.Timestamp(value)
+    return value
+
+
+def _range_violations(series: pd.Series, lower, upper) -> np.ndarray:
+    """範囲外の値をTrueとするマスク（数値として解釈できない値は型のルールで検出する）"""
+    if not (pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)):
+        series = pd.to_numeric(series, errors="coerce")
+    mask = np.zeros(len(series), dtype=bool)
+    if lower is not None:
+        mask |= (series < _bound(series, lower)).fillna(False).to_numpy(dtype=bool)
+    if upper is not None:
+        mask |= (series > _bound(series, upper)).fillna(False).to_numpy(dtype=bool)
+    return mask
+
+
+def _pattern_violations(series: pd.Series, pattern: str) -> np.ndarray:
+    """正規表現に全体が一致しない値をTrueとするマスク"""
+    regex = re.compile(pattern)
+    return _map_unique(series, lambda values: ~values.astype(str).str.fullmatch(regex).fillna(False))
+
+
+def _unique_keys(chunk: pd.DataFrame, keys: List[str]) -> np.ndarray:
+    """一意性の判定に使うキー（キーの列の組ごとの64ビットのハッシュ値）
+
+    チャンクをまたいで同じ記録と照合するため、キーの列数や型によらず全て行のハッシュ値にそろえる。
+    欠損値を含むチャンクで整数の列がfloat型として読み込まれた場合も同じキーになるよう、
+    数値の列は値が全て整数ならint64に変換してからハッシュ値を求める
+    """
+    frame = {}
+    for key in keys:
+        values = chunk[key]
+        if values.dtype.kind in "iuf":
+            numbers = values.to_numpy()
+            if values.dtype.kind in "iu" or np.array_equal(numbers, np.floor(numbers)):
+                values = numbers.astype(np.int64, copy=False)
+        frame[key] = values
+    return hash_rows(pd.DataFrame(frame, index=chunk.index))
+
+
+class RuleValidator:
+    """ルールごとの違反件数・違反例・違反行をチャンク単位で集計する"""
+
+    def __init__(self, rules: List[Dict], columns: List[str]):
+        for rule in rules:
+            check_rule(rule, columns)
+        self.rules = list(rules)
+        self.names = [rule_name(rule) for rule in rules]
+        self.rows = 0
+        self.counts = np.zeros(len(rules), dtype=np.int64)
+        self.samples: List[List[pd.DataFrame]] = [[] for _ in rules]
+        self.bad_rows: List[pd.DataFrame] = []
+        self.bad_count = 0
+        # 一意性はチャンクをまたいで判定するため、出現済みの値を記録しておく
+        self._trackers = {i: DuplicateTracker() for i, rule in enumerate(rules) if rule["rule"] == "unique"}
+
+    def _violations(self, i: int, rule: Dict, chunk: pd.DataFrame) -> np.ndarray:
+        """1つのルールの違反行をTrueとするマスク"""
+        kind = rule["rule"]
+        if kind == "unique":
+            # キーが欠損している行は一意性の判定対象外とし、出現済みの値としても記録しない
+            keys = rule.get("columns") or [rule["column"]]
+            notna = chunk[keys].notna().all(axis=1).to_numpy()
+            target = chunk if notna.all() else chunk[notna]
+            duplicated = np.zeros(len(chunk), dtype=bool)
+            duplicated[notna] = self._trackers[i].update(_unique_keys(target, keys))
+            return duplicated
+        if kind == "expression":
+            expression = rule["expression"]
+            # 参照している列が欠損している行は条件を判定できないため違反としない
+            keys = referenced_columns(parse_filter(expression, chunk.columns.tolist()))
+            satisfied = evaluate_filter(chunk, expression, cache=None)
+            return ~satisfied & chunk[keys].notna().all(axis=1).to_numpy()
+
+        series = chunk[rule["column"]]
+        if kind == "not_null":
+            return series.isna().to_numpy()
+        if kind == "type":
+            return _type_violations(series, rule["type"])
+        if kind == "range":
+            return _range_violations(series, rule.get("min"), rule.get("max"))
+        if kind == "allowed":
+            if _is_text(series):
+                return _map_unique(series, lambda values: ~values.isin(rule["values"]))
+            return ~series.isin(rule["values"]).to_numpy(dtype=bool) & series.notna().to_numpy()
+        return _pattern_violations(series, str(rule["pattern"]))
+
+    def update(self, chunk: pd.DataFrame, row_numbers: Optional[np.ndarray] = None) -> "RuleValidator":
+        """チャンクの全ルールを評価して集計に加える
+
+        row_numbers は元データでの行番号（1始まり）。省略時はこれまでの行数から連番を振る
+        """
+        if row_numbers is None:
+            row_numbers = np.arange(self.rows + 1, self.rows + len(chunk) + 1)
+        self.rows += len(chunk)
+        if not self.rules or len(chunk) == 0:
+            return self
+
+        masks = np.column_stack([self._violations(i, rule, chunk) for i, rule in enumerate(self.rules)])
+        self.counts += masks.sum(axis=0)
+
+        for i in range(len(self.rules)):
+            needed = SAMPLE_SIZE - sum(len(sample) for sample in self.samples[i])
+            if needed > 0 and masks[:, i].any():
+                positions = np.flatnonzero(masks[:, i])[:needed]
+                self.samples[i].append(self._with_row_numbers(chunk, positions, row_numbers))
+
+        bad = masks.any(axis=1)
+        bad_positions = np.flatnonzero(bad)
+        room = MAX_BAD_ROWS - sum(len(rows) for rows in self.bad_rows)
+        if room > 0 and len(bad_positions):
+            kept = bad_positions[:room]
+            rows = self._with_row_numbers(chunk, kept, row_numbers)
+            rows.insert(1, VIOLATION_LABEL, self._violation_labels(masks[kept]))
+            self.bad_rows.append(rows)
+        self.bad_count += len(bad_positions)
+        return self
+
+    @staticmethod
+    def _with_row_numbers(chunk: pd.DataFrame, positions: np.ndarray, row_numbers: np.ndarray) -> pd.DataFrame:
+        """指定位置の行を行番号の列付きで取り出す"""
+        rows = chunk.iloc[positions].reset_index(drop=True)
+        rows.insert(0, ROW_NUMBER_LABEL, np.asarray(row_numbers)[positions])
+        return rows
+
+    def _violation_labels(self, masks: np.ndarray) -> np.ndarray:
+        """違反したルール名を「; 」区切りでつなげた文字列"""
+        labels = np.full(len(masks), "", dtype=object)
+        for i, name in enumerate(self.names):
+            hit = masks[:, i]
+            labels[hit] = np.where(labels[hit] == "", name, labels[hit] + "; " + name)
+        return labels
+
+    def report(self) -> pd.DataFrame:
+        """ルールごとの違反件数・違反率の表"""
+        rates = self.counts / self.rows * 100 if self.rows else np.zeros(len(self.rules))
+        return pd.DataFrame({
+            "ルール": self.names,
+            "種類": [RULE_KINDS[rule["rule"]] for rule in self.rules],
+            "違反件数": self.counts,
+            "違反率 (%)": np.round(rates, 2),
+        })
+
+    def category_scores(self) -> Dict[str, float]:
+        """品質指標の分類ごとの適合率（%）: 1 - 違反件数 / (行数 × ルール数)"""
+        scores = {}
+        for category in dict.fromkeys(RULE_CATEGORIES.values()):
+            indices = [i for i, rule in enumerate(self.rules) if RULE_CATEGORIES[rule["rule"]] == category]
+            if indices and self.rows:
+                checked = self.rows * len(indices)
+                scores[category] = (1 - self.counts[indices].sum() / checked) * 100
+        return scores
+
+    def sample(self, i: int) -> pd.DataFrame:
+        """ルールの違反例"""
+        if not self.samples[i]:
+            return pd.DataFrame()
+        return pd.concat(self.samples[i], ignore_index=True)
+
+    def bad_rows_frame(self) -> pd.DataFrame:
+        """いずれかのルールに違反した行（先頭から MAX_BAD_ROWS 件まで）"""
+        if not self.bad_rows:
+            return pd.DataFrame()
+        return pd.concat(self.bad_rows, ignore_index=True)
+
+
+def validate_dataframe(df: pd.DataFrame, rules: List[Dict]) -> RuleValidator:
+    """メモリ上のDataFrameを1パスで検証する（行番号はインデックスから求める）"""
+    validator = RuleValidator(rules, df.columns.tolist())
+    row_numbers = df.index.to_numpy() + 1 if pd.api.types.is_integer_dtype(df.index) else None
+    return validator.update(df, row_numbers)
+
+
+def validate_chunks(chunks: Iterable[pd.DataFrame], rules: List[Dict], columns: List[str],
+                    row_filter: Optional[Callable[[pd.DataFrame], Optional[np.ndarray]]] = None,
+                    progress: Optional[Callable[[int], None]] = None) -> RuleValidator:
+    """チャンクを順に読み込みながら検証する
+
+    row_filter はチャンクの対象行のマスク（None の場合は全行）を返す関数。
+    progress には読み込み済みの行数が渡される
+    """
+    validator = RuleValidator(rules, columns)
+    offset = 0
+    for chunk in chunks:
+        row_numbers = np.arange(offset + 1, offset + len(chunk) + 1)
+        offset += len(chunk)
+        mask = row_filter(chunk) if row_filter is not None else None
+        if mask is not None:
+            chunk = chunk[mask]
+            row_numbers = row_numbers[mask]
+        validator.update(chunk, row_numbers)
+        if progress is not None:
+            progress(offset)
+    return validator
+
+
+# ---- ルールの推定 ----
+
+def _parse_ratio(counts: pd.Series, parser: Callable[[pd.Series], pd.Series]) -> float:
+    """出現頻度の高い値のうち変換できたものの割合（出現回数で重み付け）"""
+    counts = counts.iloc[:INFER_SAMPLE_VALUES]
+    parsed = parser(pd.Series(counts.index, dtype=object)).notna().to_numpy()
+    return counts.to_numpy()[parsed].sum() / counts.sum()
+
+
+_SHAPE_CLASSES = (r"\d", "[A-Z]", "[a-z]")
+
+
+def _shape(value: str, exact: bool) -> str:
+    """英大文字・英小文字・数字の並びを正規表現にする（exact=Falseでは桁数を問わない）"""
+    classes = []
+    for char in value:
+        if char.isascii() and char.isdigit():
+            token = r"\d"
+        elif char.isascii() and char.isupper():
+            token = "[A-Z]"
+        elif char.isascii() and char.islower():
+            token = "[a-z]"
+        else:
+            token = re.escape(char)
+        if classes and classes[-1][0] == token:
+            classes[-1][1] += 1
+        else:
+            classes.append([token, 1])
+    parts = []
+    for token, count in classes:
+        if token not in _SHAPE_CLASSES:
+            parts.append(token * count)
+        elif exact:
+            parts.append(token if count == 1 else f"{token}{{{count}}}")
+        else:
+            parts.append(f"{token}+")
+    return "".join(parts)
+
+
+def _infer_pattern(uniques: pd.Series) -> Optional[str]:
+    """全ての値が同じ形式（例: 'C001' → [A-Z]\\d{3}）であればその正規表現を返す"""
+    uniques = uniques.iloc[:INFER_SAMPLE_VALUES]
+    if uniques.map(lambda value: not isinstance(value, str) or len(value) > 64 or not value.isascii()).any():
+        return None
+    for exact in (True, False):
+        shapes = set(uniques.map(lambda value: _shape(value, exact)))
+        if len(shapes) == 1:
+            pattern = shapes.pop()
+            # 記号だけ・1種類の文字だけの形式は制約として意味が薄いため使わない
+            if re.search(r"\\d|\[", pattern) and pattern not in (r"\d+", "[A-Z]+", "[a-z]+"):
+                return pattern
+    return None
+
+
+def infer_rules(df: pd.DataFrame) -> List[Dict]:
+    """データの型・欠損・値の分布から検証ルールを推定する
+
+    新しいバージョンのデータを同じルールで検証することを想定している
+    """
+    rules = []
+    for col in df.columns:
+        series = df[col]
+        values = series.dropna()
+        if values.empty:
+            continue
+        if values.size == series.size:
+            rules.append({"rule": "not_null", "column": col})
+
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_datetime64_any_dtype(series):
+            rules.append({"rule": "type", "column": col, "type": "日時"})
+            continue
+        if pd.api.types.is_numeric_dtype(series):
+            is_integer = pd.api.types.is_integer_dtype(series)
+            rules.append({"rule": "type", "column": col, "type": "整数" if is_integer else "数値"})
+            if values.min() >= 0:
+                rules.append({"rule": "range", "column": col, "min": 0})
+            # 狭義単調増加の整数の列はIDとみなす
+            if is_integer and values.size >= 10 and (np.diff(values.to_numpy()) > 0).all():
+                rules.append({"rule": "unique", "columns": [col]})
+            continue
+        if not _is_text(series):
+            continue
+
+        # 一部の値に文字が混じったために文字列として読み込まれた数値・日時の列を検出する
+        counts = values.value_counts()
+        if _parse_ratio(counts, lambda v: pd.to_numeric(v, errors="coerce")) >= INFER_TYPE_RATIO:
+            rules.append({"rule": "type", "column": col, "type": "数値"})
+            continue
+        if _parse_ratio(counts, lambda v: pd.to_datetime(v, errors="coerce", format="mixed")) >= INFER_TYPE_RATIO:
+            rules.append({"rule": "type", "column": col, "type": "日時"})
+            continue
+
+        nunique = len(counts)
+        if nunique <= INFER_MAX_ALLOWED_VALUES and nunique * 2 <= values.size:
+            rules.append({"rule": "allowed", "column": col, "values": sorted(counts.index.tolist(), key=str)})
+            continue
+        pattern = _infer_pattern(pd.Series(counts.index, dtype=object))
+        if pattern is not None:
+            rules.append({"rule": "pattern", "column": col, "pattern": pattern})
+        if values.size >= 10 and nunique == values.size:
+            rules.append({"rule": "unique", "columns": [col]})
+    return rules